@@ -0,0 +1,72 @@
+"""
+Checkout latency (enqueue_sale until the sale is committed) while idle and
+while src.backup.DatabaseBackup copies the database in the background.
+
+    python benchmarks/backup_checkout_latency.py [sales rows]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.backup import DatabaseBackup
+from src.db_sqlite import Database
+
+ITEMS = {'P1': {'categoria': 'Picolé', 'sabor': 'Uva', 'preco': 12.0, 'quantidade': 1}}
+
+
+def checkout(db, latencies, count, stop=None):
+    # One sale every 20 ms, about as fast as a busy counter
+    for _ in range(count):
+        if stop is not None and stop.is_set():
+            break
+        started = time.perf_counter()
+        db.enqueue_sale(12.0, 'Pix', ITEMS).wait()
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.02)
+
+
+def summary(latencies):
+    ordered = sorted(latencies)
+    return (f"p50 {statistics.median(ordered) * 1000:6.2f} ms  "
+            f"p99 {ordered[int(len(ordered) * 0.99)] * 1000:6.2f} ms  "
+            f"max {ordered[-1] * 1000:6.2f} ms  (n={len(ordered)})")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    folder = tempfile.mkdtemp()
+    db = Database(os.path.join(folder, 'database.db'))
+    # Enough history that a backup takes a while
+    payload = '{"x": "' + 'y' * 300 + '"}'
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO sales (sale_id, timestamp, final_price, payment_method, products_json, sync_status) VALUES (?, ?, ?, ?, ?, ?)",
+            ((str(uuid.uuid4()), '2026-09-01 10:00:00.000000', 10.0, 'Pix', payload, 'synced') for _ in range(rows))
+        )
+    print(f"database {os.path.getsize(db.db_path) / 1e6:.1f} MB")
+
+    idle = []
+    checkout(db, idle, 200)
+
+    during, stop = [], threading.Event()
+    counter = threading.Thread(target=checkout, args=(db, during, 10 ** 6, stop))
+    counter.start()
+    started = time.perf_counter()
+    path = DatabaseBackup(db, keep=1).run()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    counter.join()
+
+    print(f"backup {elapsed:.2f}s, verified: {path is not None}")
+    print(f"  checkout idle:          {summary(idle)}")
+    print(f"  checkout during backup: {summary(during)}")
+
+
+if __name__ == '__main__':
+    main()
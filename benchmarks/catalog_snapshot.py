@@ -0,0 +1,72 @@
+"""
+Catalog snapshot at launch size: single lookups on the mapped file against
+SQL, and filling the CatalogIndex from the snapshot against querying every
+product.
+
+    python benchmarks/catalog_snapshot.py [products] [lookups]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.barcode import gtin_check_digit
+from src.db_sqlite import Database
+
+
+def ean13():
+    body = ''.join(random.choice('0123456789') for _ in range(12))
+    return body + gtin_check_digit(body)
+
+
+def per_call(call, args):
+    started = time.perf_counter()
+    for arg in args:
+        call(arg)
+    return (time.perf_counter() - started) / len(args) * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    random.seed(2)
+    folder = tempfile.mkdtemp()
+    db = Database(os.path.join(folder, 'database.db'))
+    codes = list({ean13() for _ in range(count)})
+    db.replace_all_products({'product_id': f'id-{i:07d}', 'barcode': code, 'marca': 'M', 'categoria': 'Picolé',
+                             'sabor': f'Sabor {i}', 'prices': {'Loja A': 1.0}} for i, code in enumerate(codes))
+    db.build_shop_catalog('Loja A')
+    # Measure the lookups themselves, not the LRU
+    db.product_cache.maxsize = 0
+    barcodes = random.sample(codes, lookups)
+    ids = [f'id-{random.randrange(len(codes)):07d}' for _ in range(lookups)]
+
+    started = time.perf_counter()
+    db.write_catalog_snapshot('Loja A')
+    print(f"{len(codes)} products, snapshot written in {time.perf_counter() - started:.2f}s")
+    snapshot = db.catalog_snapshot
+    print(f"  barcode lookup: snapshot {per_call(snapshot.find_barcode, barcodes):6.1f} us, "
+          f"SQL {per_call(lambda c: db.get_products_by_barcode_and_shop(c, 'Loja A'), barcodes):6.1f} us")
+    print(f"  product_id lookup: snapshot {per_call(snapshot.get, ids):6.1f} us, "
+          f"SQL {per_call(lambda i: db.get_product_info(i, 'Loja A'), ids):6.1f} us")
+
+    started = time.perf_counter()
+    db.enable_catalog_index('Loja A')
+    from_snapshot = time.perf_counter() - started
+
+    # Same call with no snapshot to read from
+    db.catalog_snapshot = None
+    db.open_catalog_snapshot = lambda shop_name, path=None: False
+    db.write_catalog_snapshot = lambda shop_name: False
+    started = time.perf_counter()
+    db.enable_catalog_index('Loja A')
+    from_sql = time.perf_counter() - started
+    print(f"  enable_catalog_index: from snapshot {from_snapshot:.2f}s, from SQL {from_sql:.2f}s "
+          f"({from_sql / from_snapshot:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Scanner bursts with a high miss rate (codes that aren't in the catalog),
+per lookup path, with and without the barcode Bloom filter.
+
+    python benchmarks/scanner_burst.py [products] [scans] [miss rate]
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.barcode import gtin_check_digit
+from src.db_sqlite import Database
+
+
+def ean13():
+    body = ''.join(random.choice('0123456789') for _ in range(12))
+    return body + gtin_check_digit(body)
+
+
+def burst(db, scans):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for code in scans:
+            db.get_products_by_barcode_and_shop(code, 'Loja A')
+    return (time.perf_counter() - started) / len(scans) * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    miss_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.9
+    random.seed(1)
+    folder = tempfile.mkdtemp()
+    db = Database(os.path.join(folder, 'database.db'))
+
+    codes = list({ean13() for _ in range(count)})
+    db.replace_all_products({'product_id': str(i), 'barcode': code, 'marca': 'M', 'prices': {'Loja A': 1.0}}
+                            for i, code in enumerate(codes))
+    db.build_shop_catalog('Loja A')
+    known = set(codes)
+    misses = []
+    while len(misses) < int(total * miss_rate):
+        code = ean13()
+        if code not in known:
+            misses.append(code)
+    scans = misses + random.sample(codes, total - len(misses))
+    random.shuffle(scans)
+
+    started = time.perf_counter()
+    bloom = db.build_barcode_filter()
+    built = time.perf_counter() - started
+    false_positives = sum(code in bloom for code in misses) / len(misses)
+    print(f"{len(codes)} products, {total} scans, {miss_rate:.0%} misses")
+    print(f"filter: built in {built:.2f}s, {len(bloom.data) / 1024:.0f} KiB, k={bloom.hashes}, "
+          f"false positives {false_positives:.2%}")
+
+    def compare(label):
+        db.barcode_filter = None
+        without = burst(db, scans)
+        db.barcode_filter = bloom
+        with_filter = burst(db, scans)
+        print(f"  {label:<14} {without:7.1f} -> {with_filter:7.1f} us/scan")
+
+    compare('SQL')
+    db.enable_catalog_index('Loja A')
+    # The warm index is checked before the filter: this one shouldn't move
+    compare('catalog index')
+
+
+if __name__ == '__main__':
+    main()
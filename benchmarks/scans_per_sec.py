@@ -0,0 +1,60 @@
+"""
+Barcode scans per second on the local cache, with a connection per query
+(how Database worked before the pool) and with the per-thread pool.
+Each scan is what the counter does: the barcode lookup, then the line-item
+lookup for the cart. The catalog index/snapshot are left off so both runs
+go to SQL.
+
+    python benchmarks/scans_per_sec.py [products] [scans]
+"""
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.db_sqlite import Database
+
+
+def scan(db, codes):
+    started = time.perf_counter()
+    # A miss prints; keep the timing about the lookups
+    with contextlib.redirect_stdout(io.StringIO()):
+        for code in codes:
+            found = db.get_products_by_barcode_and_shop(code, 'Loja A')
+            db.get_product_info(found[0]['product_id'], 'Loja A')
+    return len(codes) / (time.perf_counter() - started)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    scans = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    folder = tempfile.mkdtemp()
+    db = Database(os.path.join(folder, 'database.db'))
+    db.replace_all_products({
+        'product_id': f'p{i}', 'barcode': str(7890000000000 + i), 'categoria': 'Picolé',
+        'sabor': f'Sabor {i}', 'marca': 'X', 'prices': {'Loja A': 5.0, 'Loja B': 6.0},
+    } for i in range(count))
+    codes = [str(7890000000000 + random.randrange(count)) for _ in range(scans)]
+    # Line-item lookups would otherwise be served from the LRU after the first pass
+    db.product_cache.maxsize = 0
+
+    pooled = db.get_connection
+    # Before: a fresh sqlite3.connect() for every query, closed when dropped
+    db.get_connection = lambda: sqlite3.connect(db.db_path)
+    before = scan(db, codes)
+    db.get_connection = pooled
+    after = scan(db, codes)
+
+    print(f"{count} products, {scans} scans (barcode + line-item lookup)")
+    print(f"  connection per query: {before:8.0f} scans/s")
+    print(f"  per-thread pool:      {after:8.0f} scans/s  ({after / before:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Sales upload throughput: one PutItem per sale (the old sync) against
+upload_sales' BatchWriteItem batches, on an in-process DynamoDB stand-in
+with a fixed round-trip time and a share of UnprocessedItems.
+Needs boto3 installed (src.aws_db imports it); no AWS account is used.
+
+    python benchmarks/upload_sales.py [sales] [round trip ms] [unprocessed rate]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.aws_db as aws_db
+from src.db_sqlite import Database
+
+
+class StandInTable:
+    def __init__(self, name, cloud):
+        self.name = name
+        self.cloud = cloud
+
+    def put_item(self, Item):
+        time.sleep(self.cloud.latency)
+        self.cloud.store(self.name, [Item])
+
+
+class StandInResource:
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def batch_write_item(self, RequestItems):
+        time.sleep(self.cloud.latency)
+        unprocessed = {}
+        for name, requests in RequestItems.items():
+            written = []
+            for request in requests:
+                if random.random() < self.cloud.unprocessed_rate:
+                    unprocessed.setdefault(name, []).append(request)
+                else:
+                    written.append(request['PutRequest']['Item'])
+            self.cloud.store(name, written)
+        return {'UnprocessedItems': unprocessed}
+
+
+class StandInCloud:
+    """Just enough of DynamoDB for the sales upload path."""
+
+    def __init__(self, latency, unprocessed_rate):
+        self.latency = latency
+        self.unprocessed_rate = unprocessed_rate
+        self.lock = threading.Lock()
+        self.items = {}
+
+    def store(self, name, items):
+        with self.lock:
+            for item in items:
+                self.items[(name, item['shop_name'], item['timestamp'])] = item
+
+    def database(self, scan_segments=8):
+        # Skips __init__: no credentials, no table checks
+        cloud = aws_db.Database.__new__(aws_db.Database)
+        cloud.scan_segments = scan_segments
+        cloud._local = threading.local()
+        cloud._pool = None
+        cloud._pool_lock = threading.Lock()
+        cloud.sales_table = StandInTable('SalesApp_Sales', self)
+        cloud._thread_resource = lambda: StandInResource(self)
+        return cloud
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 10.0) / 1000
+    unprocessed_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+    folder = tempfile.mkdtemp()
+    db = Database(os.path.join(folder, 'database.db'))
+    for i in range(count):
+        db.record_sale(5.0, 'Pix', {'P1': {'quantidade': 1, 'preco': 5.0}}, timestamp=f'2026-10-15 10:00:00.{i:06d}')
+
+    # Before: one put_item + one local commit per sale (a sample; it's slow)
+    stand_in = StandInCloud(latency, 0.0)
+    cloud = stand_in.database()
+    sample = db.get_pending_sales()[:min(count, 300)]
+    started = time.perf_counter()
+    for sale in sample:
+        cloud.record_sale('Loja A', sale)
+        db.mark_sale_synced(sale['sale_id'])
+    serial = len(sample) / (time.perf_counter() - started)
+    with db.get_connection() as conn:
+        conn.execute("UPDATE sales SET sync_status = 'pending'")
+
+    stand_in = StandInCloud(latency, unprocessed_rate)
+    cloud = stand_in.database()
+    started = time.perf_counter()
+    uploaded = cloud.upload_sales('Loja A', db.get_pending_sales(), on_batch=db.mark_sales_synced)
+    batched = len(uploaded) / (time.perf_counter() - started)
+
+    print(f"{count} sales, {latency * 1000:.0f} ms round trip, {unprocessed_rate:.0%} unprocessed per attempt")
+    print(f"  put_item per sale: {serial:8.0f} sales/s")
+    print(f"  upload_sales:      {batched:8.0f} sales/s  ({batched / serial:.0f}x)")
+    print(f"  in the stand-in: {len(stand_in.items)}, still pending locally: {len(db.get_pending_sales())}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,46 @@
 
 import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import ClientError, EndpointConnectionError, ConnectionClosedError, ReadTimeoutError
 import json
 import os
 import decimal
+import queue
+import random
+import threading
 import time
 import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+# Errors worth retrying the same request for (throttling, transient server/network faults)
+RETRYABLE_ERROR_CODES = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'InternalServerError',
+    'ServiceUnavailable',
+}
+
+# Delta sync reads LastUpdatedIndex (PK update_shard, SK last_updated). Items are
+# spread over a few shard values so index writes don't all land on one partition.
+LAST_UPDATED_INDEX = 'LastUpdatedIndex'
+UPDATE_SHARDS = 8
+# Table tag set once every item has an update_shard; until then delta sync scans
+BACKFILL_DONE_TAG = 'SalesApp:UpdateShardBackfill'
+
+# Per process and table name, since a Database is built for every sync:
+# backfill state ('running', 'done' or 'failed'; failed ones wait for the next
+# launch) and the tables whose tags we aren't allowed to read or write.
+_backfill_lock = threading.Lock()
+_backfill_state = {}
+_tags_denied = set()
+
+
+def update_shard(product_id):
+    """Shard of LastUpdatedIndex a product is written under (stable across processes)."""
+    return str(zlib.crc32(str(product_id).encode('utf-8')) % UPDATE_SHARDS)
+
 # Helper class to convert Python objects to DynamoDB format
 class DecimalEncoder(json.JSONEncoder):
     def default(self, o):
@@ -19,7 +52,10 @@ class DecimalEncoder(json.JSONEncoder):
         return super(DecimalEncoder, self).default(o)
 
 class Database:
-    def __init__(self, region_name='us-east-1'):
+    # Parallel scan segments; scans wait on the network, not the CPU
+    DEFAULT_SCAN_SEGMENTS = min(16, (os.cpu_count() or 2) * 2)
+
+    def __init__(self, region_name='us-east-1', scan_segments=None):
         # 1. Try to load embedded credentials (priority for built exe)
         try:
             import src.embedded_credentials as embedded
@@ -34,7 +70,13 @@ class Database:
                 os.environ['AWS_SHARED_CREDENTIALS_FILE'] = local_creds
 
         # Initialize DynamoDB resource
+        self.region_name = region_name
         self.dynamodb = boto3.resource('dynamodb', region_name=region_name)
+        self.scan_segments = scan_segments or self.DEFAULT_SCAN_SEGMENTS
+        # boto3 resources aren't thread-safe: pool threads build their own (see _thread_table)
+        self._local = threading.local()
+        self._pool = None
+        self._pool_lock = threading.Lock()
         
         # Table References
         self.public_shops_table = self.dynamodb.Table('SalesApp_PublicShops')
@@ -62,7 +104,8 @@ class Database:
                     self.public_shops_table.wait_until_exists()
             
             # PRODUCTS TABLE (V3)
-            # Strategy: PK = product_id (UUID), GSI = BarcodeIndex (barcode)
+            # Strategy: PK = product_id (UUID), GSI = BarcodeIndex (barcode),
+            # GSI = LastUpdatedIndex (update_shard, last_updated) for delta sync
             try:
                 self.products_table.load()
             except ClientError as e:
@@ -75,7 +118,9 @@ class Database:
                         ],
                         AttributeDefinitions=[
                             {'AttributeName': 'product_id', 'AttributeType': 'S'},
-                            {'AttributeName': 'barcode', 'AttributeType': 'S'}
+                            {'AttributeName': 'barcode', 'AttributeType': 'S'},
+                            {'AttributeName': 'update_shard', 'AttributeType': 'S'},
+                            {'AttributeName': 'last_updated', 'AttributeType': 'S'}
                         ],
                         GlobalSecondaryIndexes=[
                             {
@@ -86,11 +131,16 @@ class Database:
                                 'Projection': {
                                     'ProjectionType': 'ALL'
                                 }
-                            }
+                            },
+                            self._last_updated_index_spec()
                         ],
                         BillingMode='PAY_PER_REQUEST'
                     )
                     self.products_table.wait_until_exists()
+                    # Born with the index: nothing to backfill
+                    self._mark_backfill_done()
+            else:
+                self._ensure_last_updated_index()
 
             # SALES TABLE
             try:
@@ -115,6 +165,283 @@ class Database:
         except ClientError as e:
             print(f"Error initializing DynamoDB tables: {e}")
 
+    # --- Delta Index ---
+
+    def _last_updated_index_spec(self):
+        return {
+            'IndexName': LAST_UPDATED_INDEX,
+            'KeySchema': [
+                {'AttributeName': 'update_shard', 'KeyType': 'HASH'},
+                {'AttributeName': 'last_updated', 'KeyType': 'RANGE'},
+            ],
+            # Delta rows need every attribute (all the price_ columns)
+            'Projection': {'ProjectionType': 'ALL'}
+        }
+
+    def _last_updated_index_status(self):
+        for index in self.products_table.global_secondary_indexes or []:
+            if index['IndexName'] == LAST_UPDATED_INDEX:
+                return index.get('IndexStatus')
+        return None
+
+    def _ensure_last_updated_index(self):
+        """
+        Migration for tables created before LastUpdatedIndex: adds the index
+        and backfills update_shard on existing items in the background.
+        DynamoDB builds the index online; delta sync keeps scanning until it is
+        ACTIVE and the backfill has finished. A backfill cut short (app closed,
+        error) is started again on the next launch.
+        """
+        if self._last_updated_index_status() is not None:
+            if not self._update_shards_backfilled():
+                self._start_backfill()
+            return
+        print(f"Adding {LAST_UPDATED_INDEX} to SalesApp_Products_V3...")
+        try:
+            self.products_table.meta.client.update_table(
+                TableName=self.products_table.name,
+                AttributeDefinitions=[
+                    {'AttributeName': 'update_shard', 'AttributeType': 'S'},
+                    {'AttributeName': 'last_updated', 'AttributeType': 'S'}
+                ],
+                GlobalSecondaryIndexUpdates=[{'Create': self._last_updated_index_spec()}]
+            )
+        except ClientError as e:
+            # Another terminal got there first, or no permission: delta sync keeps scanning
+            print(f"Could not create {LAST_UPDATED_INDEX}: {e}")
+            return
+        self._start_backfill()
+
+    def _start_backfill(self):
+        """Starts the backfill unless this process already ran or is running it."""
+        with _backfill_lock:
+            if _backfill_state.get(self.products_table.name) is not None:
+                return
+            _backfill_state[self.products_table.name] = 'running'
+        # Its own thread, not the scan pool: it reads slowly and would hold pool workers
+        threading.Thread(target=self.backfill_update_shards, name="BackfillUpdateShards", daemon=True).start()
+
+    def _tags_error(self, action, e):
+        # Typically AccessDenied: say so once, then stop asking
+        name = self.products_table.name
+        with _backfill_lock:
+            if name in _tags_denied:
+                return
+            _tags_denied.add(name)
+        print(f"Could not {action} products table tags ({e}); delta sync scans until a backfill pass completes")
+
+    def _mark_backfill_done(self):
+        """
+        Records a complete pass: in this process (enough to switch delta sync
+        to the index) and as BACKFILL_DONE_TAG for the other terminals and the
+        next launch. Without tag permissions each launch pays one backfill
+        pass (which finds nothing) instead.
+        """
+        name = self.products_table.name
+        with _backfill_lock:
+            _backfill_state[name] = 'done'
+            if name in _tags_denied:
+                return
+        try:
+            self.products_table.meta.client.tag_resource(
+                ResourceArn=self.products_table.table_arn,
+                Tags=[{'Key': BACKFILL_DONE_TAG, 'Value': 'done'}]
+            )
+        except ClientError as e:
+            self._tags_error('write', e)
+
+    def _update_shards_backfilled(self):
+        """True once a backfill pass has run to the end, here or anywhere (BACKFILL_DONE_TAG)."""
+        name = self.products_table.name
+        with _backfill_lock:
+            if _backfill_state.get(name) == 'done':
+                return True
+            if name in _tags_denied:
+                return False
+        try:
+            client = self.products_table.meta.client
+            response = self._with_retry(client.list_tags_of_resource, ResourceArn=self.products_table.table_arn)
+            tags = {tag['Key']: tag['Value'] for tag in response.get('Tags', [])}
+        except ClientError as e:
+            # Can't tell: keep scanning, which is always correct
+            self._tags_error('read', e)
+            return False
+        if tags.get(BACKFILL_DONE_TAG) != 'done':
+            return False
+        with _backfill_lock:
+            _backfill_state[name] = 'done'
+        return True
+
+    def _delta_index_ready(self):
+        status = self._last_updated_index_status()
+        if status not in (None, 'ACTIVE'):
+            # Still building: look again (one DescribeTable per sync)
+            try:
+                self.products_table.reload()
+            except ClientError as e:
+                print(f"Error describing products table: {e}")
+            status = self._last_updated_index_status()
+        # Items the backfill hasn't reached yet aren't in the index
+        return status == 'ACTIVE' and self._update_shards_backfilled()
+
+    def backfill_update_shards(self):
+        """
+        Sets update_shard on every item that has a last_updated but no shard
+        (written before the index existed, or by an older app version), so it
+        shows up in LastUpdatedIndex. Idempotent: safe to re-run or interrupt.
+        Once the whole table has been read it tags the table (BACKFILL_DONE_TAG)
+        so delta sync can switch to the index. Returns the number of items updated.
+
+        A plain serial scan on the calling thread: it's a one-off, and on the
+        scan pool it would keep workers blocked behind its slow consumer.
+        A pass that fails isn't retried until the next launch.
+        """
+        updated = 0
+        # boto3 resources aren't thread-safe: this thread gets its own
+        table = self._thread_table(self.products_table.name)
+        request = dict(
+            ProjectionExpression="product_id",
+            FilterExpression=boto3.dynamodb.conditions.Attr('last_updated').exists()
+                & boto3.dynamodb.conditions.Attr('update_shard').not_exists()
+        )
+        try:
+            while True:
+                response = self._with_retry(table.scan, **request)
+                for item in response.get('Items', []):
+                    try:
+                        self._with_retry(
+                            table.update_item,
+                            Key={'product_id': item['product_id']},
+                            UpdateExpression="SET update_shard = :shard",
+                            ConditionExpression="attribute_exists(product_id)",
+                            ExpressionAttributeValues={':shard': update_shard(item['product_id'])}
+                        )
+                        updated += 1
+                    except ClientError as e:
+                        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                            raise
+                last_key = response.get('LastEvaluatedKey')
+                if not last_key:
+                    break
+                request['ExclusiveStartKey'] = last_key
+            self._mark_backfill_done()
+            print(f"Backfilled update_shard on {updated} products")
+        except (ClientError, EndpointConnectionError, ConnectionClosedError, ReadTimeoutError) as e:
+            # Picked up again on the next launch
+            print(f"Error backfilling update_shard: {e}")
+            with _backfill_lock:
+                _backfill_state[self.products_table.name] = 'failed'
+        return updated
+
+    # --- Parallel Scans ---
+
+    def _thread_resource(self):
+        """This thread's own DynamoDB resource (one boto3 session per pool thread)."""
+        resource = getattr(self._local, 'resource', None)
+        if resource is None:
+            session = boto3.session.Session()
+            self._local.resource = resource = session.resource('dynamodb', region_name=self.region_name)
+            self._local.tables = {}
+        return resource
+
+    def _thread_table(self, table_name):
+        resource = self._thread_resource()
+        tables = self._local.tables
+        if table_name not in tables:
+            tables[table_name] = resource.Table(table_name)
+        return tables[table_name]
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.scan_segments, thread_name_prefix='DynamoScan')
+            return self._pool
+
+    def _with_retry(self, call, attempts=6, **kwargs):
+        """Runs one request, retrying throttling and transient errors with jittered backoff."""
+        for attempt in range(attempts):
+            try:
+                return call(**kwargs)
+            except ClientError as e:
+                if e.response['Error']['Code'] not in RETRYABLE_ERROR_CODES or attempt == attempts - 1:
+                    raise
+            except (EndpointConnectionError, ConnectionClosedError, ReadTimeoutError):
+                if attempt == attempts - 1:
+                    raise
+            time.sleep(min(0.1 * 2 ** attempt, 5.0) * (0.5 + random.random()))
+
+    def _scan_pages(self, table, segments=None, progress_callback=None, **kwargs):
+        """
+        Parallel scan of `table` (a Table; its name is used) split into
+        Segment/TotalSegments run on the scan pool. Yields each page's Items as
+        soon as any segment returns it, so order is not preserved.
+        progress_callback(count) is called from the caller's thread with the
+        running total over all segments.
+        """
+        segments = segments or self.scan_segments
+        if segments > 1:
+            requests = [dict(kwargs, Segment=segment, TotalSegments=segments) for segment in range(segments)]
+        else:
+            requests = [kwargs]
+        return self._parallel_pages(table, 'scan', requests, progress_callback)
+
+    def _parallel_pages(self, table, operation, requests, progress_callback=None):
+        """
+        Runs each request (kwargs for table.scan/table.query) on the scan pool,
+        following its LastEvaluatedKey, and yields pages as they arrive.
+        Each request retries its own failed page (see _with_retry) and resumes
+        from its last key; an error that survives the retries is raised here.
+        """
+        table_name = table.name
+        pages = queue.Queue(maxsize=len(requests) * 2)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            # Bounded queue: give up if the consumer went away
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def read(request):
+            try:
+                call = getattr(self._thread_table(table_name), operation)
+                request = dict(request)
+                while not stop.is_set():
+                    response = self._with_retry(call, **request)
+                    put(response.get('Items', []))
+                    last_key = response.get('LastEvaluatedKey')
+                    if not last_key:
+                        break
+                    request['ExclusiveStartKey'] = last_key
+                put(done)
+            except Exception as e:
+                put(e)
+
+        pool = self._executor()
+        for request in requests:
+            pool.submit(read, request)
+
+        count = 0
+        finished = 0
+        try:
+            while finished < len(requests):
+                page = pages.get()
+                if page is done:
+                    finished += 1
+                    continue
+                if isinstance(page, Exception):
+                    raise page
+                count += len(page)
+                if progress_callback:
+                    progress_callback(count)
+                yield page
+        finally:
+            stop.set()
+
     # --- Shop Management ---
 
     def get_shops(self):
@@ -159,51 +486,73 @@ class Database:
         If 'product_id' is missing, generates a new one (UUID).
         Updates metadata and the specific shop's price column.
         """
-        product_id = product_info.get('product_id')
-        barcode = product_info['barcode']
-        category = product_info.get('categoria', '')
-        flavor = product_info.get('sabor', '')
-        brand = product_info.get('marca', '')
-        
-        # If no product_id, this is technically a NEW product entity.
-        if not product_id:
-            product_id = str(uuid.uuid4())
-
-        # Price
-        try:
-            raw_price = product_info.get('preco', 0)
-            price = decimal.Decimal(str(raw_price))
-        except:
-            price = decimal.Decimal('0')
-
-        price_attr = self._get_price_attr_name(shop_name)
-
+        product_id = product_info.get('product_id') or str(uuid.uuid4())
         try:
             # UpdateItem allows us to create or update attributes
-            # Add last_updated timestamp
-            timestamp = datetime.now().isoformat()
-            
-            self.products_table.update_item(
-                Key={'product_id': product_id},
-                UpdateExpression="SET barcode=:code, category=:cat, flavor=:flav, brand=:brand, #p=:price, last_updated=:ts",
-                ExpressionAttributeNames={
-                    '#p': price_attr
-                },
-                ExpressionAttributeValues={
-                    ':code': barcode,
-                    ':cat': category,
-                    ':flav': flavor,
-                    ':brand': brand,
-                    ':price': price,
-                    ':ts': timestamp
-                }
-            )
+            self.products_table.update_item(**self._product_update(product_id, product_info, {shop_name: product_info.get('preco', 0)}))
             return product_id
             
         except ClientError as e:
             print(f"Error adding product: {e}")
             raise e
 
+    def add_products(self, products):
+        """
+        Bulk add_product. Each item is an add_product dict plus 'prices'
+        ({Shop: Price}, every shop price to write for it); all of a product's
+        prices go in ONE UpdateItem, and products are written concurrently on
+        the scan pool (throttling is retried).
+        New products get a UUID. Returns one (product_id, error) per item, in
+        order: error is None on success, else the exception.
+        """
+        product_ids = [p.get('product_id') or str(uuid.uuid4()) for p in products]
+        table_name = self.products_table.name
+
+        def write(product_id, product_info):
+            table = self._thread_table(table_name)
+            try:
+                self._with_retry(table.update_item, **self._product_update(product_id, product_info, product_info.get('prices') or {}))
+                return product_id, None
+            except Exception as e:
+                print(f"Error adding product {product_info.get('barcode')}: {e}")
+                return product_id, e
+
+        pool = self._executor()
+        futures = [pool.submit(write, pid, p) for pid, p in zip(product_ids, products)]
+        return [future.result() for future in futures]
+
+    def _product_update(self, product_id, product_info, prices):
+        """UpdateItem arguments setting the metadata, last_updated and the given shop prices."""
+        # Add last_updated timestamp
+        timestamp = datetime.now().isoformat()
+        sets = ["barcode=:code", "category=:cat", "flavor=:flav", "brand=:brand", "last_updated=:ts", "update_shard=:shard"]
+        names = {}
+        values = {
+            ':code': product_info['barcode'],
+            ':cat': product_info.get('categoria', ''),
+            ':flav': product_info.get('sabor', ''),
+            ':brand': product_info.get('marca', ''),
+            ':ts': timestamp,
+            ':shard': update_shard(product_id)
+        }
+        for i, (shop_name, raw_price) in enumerate(prices.items()):
+            try:
+                price = decimal.Decimal(str(raw_price))
+            except:
+                price = decimal.Decimal('0')
+            sets.append(f"#p{i}=:price{i}")
+            names[f'#p{i}'] = self._get_price_attr_name(shop_name)
+            values[f':price{i}'] = price
+
+        update = {
+            'Key': {'product_id': product_id},
+            'UpdateExpression': "SET " + ", ".join(sets),
+            'ExpressionAttributeValues': values
+        }
+        if names:
+            update['ExpressionAttributeNames'] = names
+        return update
+
     def delete_product(self, product_id, shop_name):
         """
         Removes the price column for this shop.
@@ -215,9 +564,9 @@ class Database:
         try:
             self.products_table.update_item(
                 Key={'product_id': product_id},
-                UpdateExpression="REMOVE #p SET last_updated=:ts",
+                UpdateExpression="REMOVE #p SET last_updated=:ts, update_shard=:shard",
                 ExpressionAttributeNames={'#p': price_attr},
-                ExpressionAttributeValues={':ts': timestamp}
+                ExpressionAttributeValues={':ts': timestamp, ':shard': update_shard(product_id)}
             )
         except ClientError as e:
             print(f"Error deleting product (price removal): {e}")
@@ -240,121 +589,109 @@ class Database:
         """
         Fetches products. 
         If last_sync_ts provided, returns only items modified after that time.
+        List version of iter_products_delta.
         """
         try:
-            items = []
-            kwargs = {}
-            price_attr = ""
-            
-            filter_exp = None
-            
-            if shop_name:
-                price_attr = self._get_price_attr_name(shop_name)
-                # FilterExpression: attribute_exists(price_Shop_A)
-                filter_exp = boto3.dynamodb.conditions.Attr(price_attr).exists()
-            
-            if last_sync_ts:
-                # Add timestamp filter
-                ts_filter = boto3.dynamodb.conditions.Attr('last_updated').gt(last_sync_ts)
-                if filter_exp:
-                    filter_exp = filter_exp & ts_filter
-                else:
-                    filter_exp = ts_filter
-            
-            if filter_exp:
-                kwargs['FilterExpression'] = filter_exp
-            
-            while True:
-                response = self.products_table.scan(**kwargs)
-                chunk = response.get('Items', [])
-                items.extend(chunk)
-                
-                if progress_callback:
-                    progress_callback(len(items))
-                
-                last_key = response.get('LastEvaluatedKey')
-                if not last_key:
-                    break
-                kwargs['ExclusiveStartKey'] = last_key
-                
-            # Flatten results
-            results = []
-            for item in items:
-                # If filtered by shop, we return that one price
-                if shop_name:
-                    p_val = item.get(price_attr, 0.0)
-                    results.append({
-                        'product_id': item['product_id'],
-                        'barcode': item['barcode'],
-                        'categoria': item.get('category', ''),
-                        'sabor': item.get('flavor', ''),
-                        'marca': item.get('brand', ''),
-                        'preco': float(p_val),
-                        'shop_name': shop_name,
-                        'last_updated': item.get('last_updated', '')
-                    })
-                else:
-                    # If all, return all found prices?
-                    # Find all attributes starting with price_
-                    keys = [k for k in item.keys() if k.startswith("price_")]
-                    
-                    if not keys:
-                         # Product exists but has no prices yet (Unlisted)
-                         results.append({
-                            'product_id': item['product_id'],
-                            'barcode': item['barcode'],
-                            'categoria': item.get('category', ''),
-                            'sabor': item.get('flavor', ''),
-                            'marca': item.get('brand', ''),
-                            'preco': 0.0,
-                            'shop_name': '',
-                            'last_updated': item.get('last_updated', '')
-                        })
-                    
-                    for k in keys:
-                        s_name_raw = k.replace("price_", "")
-                        s_name = s_name_raw.replace("_", " ") 
-                        p_val = item[k]
-                        results.append({
-                            'product_id': item['product_id'],
-                            'barcode': item['barcode'],
-                            'categoria': item.get('category', ''),
-                            'sabor': item.get('flavor', ''),
-                            'marca': item.get('brand', ''),
-                            'preco': float(p_val),
-                            'shop_name': s_name,
-                            'last_updated': item.get('last_updated', '')
-                        })
-
-            return results
+            return list(self.iter_products_delta(shop_name, last_sync_ts, progress_callback))
         except ClientError as e:
             print(f"Error fetching products delta: {e}")
             return []
 
+    def iter_products_delta(self, shop_name=None, last_sync_ts=None, progress_callback=None):
+        """
+        Generator version of get_products_delta: yields the flattened rows
+        (one per product and shop) page by page as the scan returns them,
+        so a full catalog never sits in memory. Errors are raised.
+        With last_sync_ts and LastUpdatedIndex active, this is one Query per
+        shard instead of a Scan, so it reads only the changed items.
+        """
+        kwargs = {}
+        price_attr = ""
+        
+        filter_exp = None
+        
+        if shop_name:
+            price_attr = self._get_price_attr_name(shop_name)
+            # FilterExpression: attribute_exists(price_Shop_A)
+            filter_exp = boto3.dynamodb.conditions.Attr(price_attr).exists()
+        
+        if last_sync_ts and self._delta_index_ready():
+            if filter_exp:
+                kwargs['FilterExpression'] = filter_exp
+            requests = [
+                dict(
+                    kwargs,
+                    IndexName=LAST_UPDATED_INDEX,
+                    KeyConditionExpression=boto3.dynamodb.conditions.Key('update_shard').eq(str(shard))
+                        & boto3.dynamodb.conditions.Key('last_updated').gt(last_sync_ts)
+                )
+                for shard in range(UPDATE_SHARDS)
+            ]
+            for chunk in self._parallel_pages(self.products_table, 'query', requests, progress_callback):
+                for item in chunk:
+                    yield from self._flatten_prices(item, shop_name)
+            return
+
+        if last_sync_ts:
+            # Add timestamp filter
+            ts_filter = boto3.dynamodb.conditions.Attr('last_updated').gt(last_sync_ts)
+            if filter_exp:
+                filter_exp = filter_exp & ts_filter
+            else:
+                filter_exp = ts_filter
+        
+        if filter_exp:
+            kwargs['FilterExpression'] = filter_exp
+        
+        for chunk in self._scan_pages(self.products_table, progress_callback=progress_callback, **kwargs):
+            for item in chunk:
+                yield from self._flatten_prices(item, shop_name)
+
+    def _flatten_prices(self, item, shop_name=None):
+        base = {
+            'product_id': item['product_id'],
+            'barcode': item['barcode'],
+            'categoria': item.get('category', ''),
+            'sabor': item.get('flavor', ''),
+            'marca': item.get('brand', ''),
+        }
+        last_updated = item.get('last_updated', '')
+
+        # If filtered by shop, we return that one price
+        if shop_name:
+            p_val = item.get(self._get_price_attr_name(shop_name), 0.0)
+            yield {**base, 'preco': float(p_val), 'shop_name': shop_name, 'last_updated': last_updated}
+            return
+
+        # If all, return all found prices
+        # Find all attributes starting with price_
+        keys = [k for k in item.keys() if k.startswith("price_")]
+        
+        if not keys:
+            # Product exists but has no prices yet (Unlisted)
+            yield {**base, 'preco': 0.0, 'shop_name': '', 'last_updated': last_updated}
+        
+        for k in keys:
+            s_name_raw = k.replace("price_", "")
+            s_name = s_name_raw.replace("_", " ") 
+            yield {**base, 'preco': float(item[k]), 'shop_name': s_name, 'last_updated': last_updated}
+
     def get_all_product_ids(self):
         """
         Fast scan to get all IDs and Barcodes for deletion detection.
         """
         try:
-            items = []
-            kwargs = {
-                'ProjectionExpression': "product_id, barcode"
-            }
-            
-            while True:
-                response = self.products_table.scan(**kwargs)
-                items.extend(response.get('Items', []))
-                
-                last_key = response.get('LastEvaluatedKey')
-                if not last_key:
-                    break
-                kwargs['ExclusiveStartKey'] = last_key
-                
-            return items
+            return list(self.iter_all_product_ids())
         except ClientError as e:
             print(f"Error fetching product IDs: {e}")
             return []
 
+    def iter_all_product_ids(self):
+        """Generator version of get_all_product_ids ({'product_id', 'barcode'} dicts). Errors are raised."""
+        for chunk in self._scan_pages(self.products_table, ProjectionExpression="product_id, barcode"):
+            for item in chunk:
+                yield {'product_id': item['product_id'], 'barcode': item['barcode']}
+
     def get_all_products_grouped(self, progress_callback=None):
         """
         Fetches all products and aggregates prices for ALL shops into a 'prices' dict.
@@ -367,55 +704,47 @@ class Database:
         }
         """
         try:
-            items = []
-            kwargs = {}
-            
-            while True:
-                response = self.products_table.scan(**kwargs)
-                chunk = response.get('Items', [])
-                items.extend(chunk)
-                
-                if progress_callback:
-                    progress_callback(len(items))
-                
-                last_key = response.get('LastEvaluatedKey')
-                if not last_key:
-                    break
-                kwargs['ExclusiveStartKey'] = last_key
-                
-            results = []
-            for item in items:
-                # Base product info
-                product = {
-                    'product_id': item['product_id'],
-                    'barcode': item['barcode'],
-                    'categoria': item.get('category', ''),
-                    'sabor': item.get('flavor', ''),
-                    'marca': item.get('brand', ''),
-                    'prices': {}
-                }
-                
-                # Extract prices
-                # Keys like "price_Shop_Name"
-                for k, v in item.items():
-                    if k.startswith("price_"):
-                        shop_raw = k.replace("price_", "")
-                        # Simple heuristic to restore spaces (matches logic in get_all_products)
-                        # We hope shop names don't have intended underscores if we rely on this.
-                        # Ideally we'd have a separate Shop table or map, but this works for the current schema.
-                        shop_name = shop_raw.replace("_", " ") 
-                        try:
-                            product['prices'][shop_name] = float(v)
-                        except:
-                            product['prices'][shop_name] = 0.0
-                            
-                results.append(product)
-
-            return results
+            return list(self.iter_all_products_grouped(progress_callback=progress_callback))
         except ClientError as e:
             print(f"Error fetching grouped products: {e}")
             return []
 
+    def iter_all_products_grouped(self, progress_callback=None):
+        """
+        Generator version of get_all_products_grouped: yields products page by page,
+        so the caller can persist them without holding the whole catalog in memory.
+        Errors are raised instead of returning a partial list.
+        """
+        for chunk in self._scan_pages(self.products_table, progress_callback=progress_callback):
+            for item in chunk:
+                yield self._group_prices(item)
+
+    def _group_prices(self, item):
+        # Base product info
+        product = {
+            'product_id': item['product_id'],
+            'barcode': item['barcode'],
+            'categoria': item.get('category', ''),
+            'sabor': item.get('flavor', ''),
+            'marca': item.get('brand', ''),
+            'prices': {}
+        }
+        
+        # Extract prices
+        # Keys like "price_Shop_Name"
+        for k, v in item.items():
+            if k.startswith("price_"):
+                shop_raw = k.replace("price_", "")
+                # Simple heuristic to restore spaces (matches logic in get_all_products)
+                # We hope shop names don't have intended underscores if we rely on this.
+                # Ideally we'd have a separate Shop table or map, but this works for the current schema.
+                shop_name = shop_raw.replace("_", " ") 
+                try:
+                    product['prices'][shop_name] = float(v)
+                except:
+                    product['prices'][shop_name] = 0.0
+        return product
+
 
     def get_product_info(self, product_id, shop_name):
         """
@@ -427,36 +756,84 @@ class Database:
             if not item:
                 return None
             
-            price_attr = self._get_price_attr_name(shop_name)
-            if price_attr not in item:
-                return None
-                
-            return {
-                'product_id': item['product_id'],
-                'barcode': item['barcode'],
-                'categoria': item.get('category', ''),
-                'sabor': item.get('flavor', ''),
-                'marca': item.get('brand', ''),
-                'preco': float(item[price_attr]),
-                'shop_name': shop_name
-            }
+            return self._shop_product(item, shop_name)
         except ClientError as e:
             print(f"Error getting product info: {e}")
             return None
 
+    def _shop_product(self, item, shop_name):
+        price_attr = self._get_price_attr_name(shop_name)
+        if price_attr not in item:
+            return None
+            
+        return {
+            'product_id': item['product_id'],
+            'barcode': item['barcode'],
+            'categoria': item.get('category', ''),
+            'sabor': item.get('flavor', ''),
+            'marca': item.get('brand', ''),
+            'preco': float(item[price_attr]),
+            'shop_name': shop_name
+        }
+
+    def get_products_info(self, product_ids, shop_name, attempts=8):
+        """
+        Batch get_product_info: BatchGetItem in requests of 100 keys, run
+        concurrently on the scan pool, projecting only the attributes a product
+        dict needs. UnprocessedKeys are requested again with jittered backoff.
+        Returns {product_id: product}; ids that don't exist or have no price
+        for shop_name are left out (get_product_info returns None for those).
+        """
+        ids = list(dict.fromkeys(pid for pid in product_ids if pid))
+        table_name = self.products_table.name
+        price_attr = self._get_price_attr_name(shop_name)
+
+        def fetch(chunk):
+            resource = self._thread_resource()
+            request = {table_name: {
+                'Keys': [{'product_id': pid} for pid in chunk],
+                'ProjectionExpression': "product_id, barcode, category, flavor, brand, #p",
+                'ExpressionAttributeNames': {'#p': price_attr}
+            }}
+            items = []
+            for attempt in range(attempts):
+                response = self._with_retry(resource.batch_get_item, RequestItems=request)
+                items.extend(response.get('Responses', {}).get(table_name, []))
+                request = response.get('UnprocessedKeys') or {}
+                if not request:
+                    return items
+                time.sleep(min(0.05 * 2 ** attempt, 5.0) * (0.5 + random.random()))
+            print(f"{len(request[table_name]['Keys'])} products still unprocessed after {attempts} attempts")
+            return items
+
+        results = {}
+        try:
+            pool = self._executor()
+            futures = [pool.submit(fetch, ids[i:i + 100]) for i in range(0, len(ids), 100)]
+            for future in futures:
+                for item in future.result():
+                    product = self._shop_product(item, shop_name)
+                    if product:
+                        results[product['product_id']] = product
+        except ClientError as e:
+            print(f"Error getting products info: {e}")
+        return results
+
     def search_products(self, term, shop_name):
         """
         Naive search.
         """
-        all_prods = self.get_all_products(shop_name=shop_name)
         term = term.lower()
         results = []
-        for p in all_prods:
-            if (term in p['barcode'].lower() or 
-                term in p['categoria'].lower() or 
-                term in p['sabor'].lower() or 
-                term in p['marca'].lower()):
-                results.append(p)
+        try:
+            for p in self.iter_products_delta(shop_name=shop_name):
+                if (term in p['barcode'].lower() or 
+                    term in p['categoria'].lower() or 
+                    term in p['sabor'].lower() or 
+                    term in p['marca'].lower()):
+                    results.append(p)
+        except ClientError as e:
+            print(f"Error searching products: {e}")
         return results
 
     def get_products_by_barcode_and_shop(self, barcode, shop_name):
@@ -505,22 +882,54 @@ class Database:
             )
             items = response.get('Items', [])
             if items:
-                item = items[0]
-                return {
-                    'product_id': item['product_id'],
-                    'barcode': item['barcode'],
-                    'categoria': item.get('category', ''),
-                    'sabor': item.get('flavor', ''),
-                    'marca': item.get('brand', ''),
-                    'preco': 0.0, # Default for new shop
-                    'reviewed': True,
-                    'scanned': True
-                }
+                return self._template(items[0])
             return None
         except Exception as e:
             print(f"Error fetching template: {e}")
             return None
 
+    def _template(self, item):
+        return {
+            'product_id': item['product_id'],
+            'barcode': item['barcode'],
+            'categoria': item.get('category', ''),
+            'sabor': item.get('flavor', ''),
+            'marca': item.get('brand', ''),
+            'preco': 0.0, # Default for new shop
+            'reviewed': True,
+            'scanned': True
+        }
+
+    def get_templates_by_barcodes(self, barcodes):
+        """
+        Batch get_template_by_barcode: BarcodeIndex can only be queried one
+        barcode at a time, so the queries run concurrently on the scan pool.
+        Returns {barcode: template or None (not in the cloud)}; a barcode whose
+        query failed is left out, so it isn't mistaken for a new product.
+        """
+        barcodes = list(dict.fromkeys(b for b in barcodes if b))
+        table_name = self.products_table.name
+
+        def lookup(barcode):
+            response = self._with_retry(
+                self._thread_table(table_name).query,
+                IndexName='BarcodeIndex',
+                KeyConditionExpression=boto3.dynamodb.conditions.Key('barcode').eq(barcode),
+                Limit=1
+            )
+            items = response.get('Items', [])
+            return self._template(items[0]) if items else None
+
+        results = {}
+        pool = self._executor()
+        futures = [(barcode, pool.submit(lookup, barcode)) for barcode in barcodes]
+        for barcode, future in futures:
+            try:
+                results[barcode] = future.result()
+            except Exception as e:
+                print(f"Error fetching template for {barcode}: {e}")
+        return results
+
     def get_prices_from_other_stores(self, barcode):
         """
         Fetches prices for the given barcode from ALL shops.
@@ -564,60 +973,150 @@ class Database:
 
     # --- Sales Management ---
 
+    def _sale_item(self, shop_name, sale_data):
+        return {
+            'shop_name': shop_name,
+            'timestamp': str(sale_data['timestamp']), # Convert to string for Range Key
+            'final_price': decimal.Decimal(str(sale_data['final_price'])),
+            'payment_method': sale_data['payment_method'],
+            'products_json': sale_data['products_json']
+        }
+
     def record_sale(self, shop_name, sale_data):
         try:
-            self.sales_table.put_item(
-                Item={
-                    'shop_name': shop_name,
-                    'timestamp': str(sale_data['timestamp']), # Convert to string for Range Key
-                    'final_price': decimal.Decimal(str(sale_data['final_price'])),
-                    'payment_method': sale_data['payment_method'],
-                    'products_json': sale_data['products_json']
-                },
-            )
+            self.sales_table.put_item(Item=self._sale_item(shop_name, sale_data))
             return True
         except ClientError as e:
              print(f"Error recording sale: {e}")
              raise e
 
+    def upload_sales(self, shop_name, sales, on_batch=None, batch_size=25, attempts=8):
+        """
+        Uploads sales with BatchWriteItem, 25 puts per request, several
+        requests in flight on the scan pool. UnprocessedItems are resent with
+        jittered exponential backoff (up to `attempts` rounds); whatever is
+        still unprocessed after that is left for the next sync.
+        on_batch(sale_ids) is called from the caller's thread with the ids of
+        each batch that fully made it, as batches finish.
+        Returns the list of uploaded sale_ids.
+        """
+        # One request can't hold the same key twice: a repeated timestamp goes to a later batch
+        batches, current, keys = [], [], set()
+        for sale in sales:
+            key = str(sale['timestamp'])
+            if len(current) == batch_size or key in keys:
+                batches.append(current)
+                current, keys = [], set()
+            current.append(sale)
+            keys.add(key)
+        if current:
+            batches.append(current)
+
+        uploaded = []
+        pool = self._executor()
+        futures = [pool.submit(self._write_sales_batch, shop_name, batch, attempts) for batch in batches]
+        for future in futures:
+            try:
+                sale_ids = future.result()
+            except Exception as e:
+                print(f"Error uploading sales batch: {e}")
+                continue
+            if sale_ids:
+                uploaded.extend(sale_ids)
+                if on_batch:
+                    on_batch(sale_ids)
+        return uploaded
+
+    def _write_sales_batch(self, shop_name, batch, attempts):
+        """One BatchWriteItem (plus retries). Returns the sale_ids written."""
+        table_name = self.sales_table.name
+        by_key = {str(sale['timestamp']): sale['sale_id'] for sale in batch}
+        requests = [{'PutRequest': {'Item': self._sale_item(shop_name, sale)}} for sale in batch]
+        resource = self._thread_resource()
+        for attempt in range(attempts):
+            response = self._with_retry(resource.batch_write_item, RequestItems={table_name: requests})
+            requests = response.get('UnprocessedItems', {}).get(table_name, [])
+            if not requests:
+                return list(by_key.values())
+            time.sleep(min(0.05 * 2 ** attempt, 5.0) * (0.5 + random.random()))
+        # Partial success: everything but what is still unprocessed
+        pending = {r['PutRequest']['Item']['timestamp'] for r in requests}
+        print(f"{len(pending)} sales still unprocessed after {attempts} attempts, retrying next sync")
+        return [sale_id for key, sale_id in by_key.items() if key not in pending]
+
     def get_sales_history(self, shop_name=None, limit=50):
+        return self.get_sales_page(shop_name=shop_name, limit=limit)[0]
+
+    def get_sales_page(self, shop_name=None, limit=50, cursor=None, start=None, end=None, payment_method=None):
         """
-        Fetches recent sales. 
-        If shop_name is provided, querying by PK (shop_name) would be ideal. 
-        However, currently table PK is shop_name, SK is timestamp.
+        One page of sales, newest first. Returns (rows, next_cursor), where
+        next_cursor is DynamoDB's LastEvaluatedKey (None on the last page).
+        Table PK is shop_name, SK is timestamp, so with a shop the date range
+        is part of the key condition; payment_method is a filter, and since
+        Limit counts items before filtering we keep reading until the page is full.
         """
         try:
-            # We need to know which shop to query for.
-            # If no shop provided, maybe scan (expensive)? 
-            # Ideally the App should pass the current shop.
-            
-            items = []
+            kwargs = {}
             if shop_name:
-                response = self.sales_table.query(
-                    KeyConditionExpression=boto3.dynamodb.conditions.Key('shop_name').eq(shop_name),
-                    ScanIndexForward=False, # Newest first
-                    Limit=limit
-                )
-                items = response.get('Items', [])
+                key = boto3.dynamodb.conditions.Key('shop_name').eq(shop_name)
+                # Stored timestamps always carry a time part, so between() with
+                # a bare 'YYYY-MM-DD' end bound behaves as [start, end)
+                if start and end:
+                    key = key & boto3.dynamodb.conditions.Key('timestamp').between(start, end)
+                elif start:
+                    key = key & boto3.dynamodb.conditions.Key('timestamp').gte(start)
+                elif end:
+                    key = key & boto3.dynamodb.conditions.Key('timestamp').lt(end)
+                kwargs['KeyConditionExpression'] = key
+                kwargs['ScanIndexForward'] = False # Newest first
+                read = self.sales_table.query
             else:
                 # Fallback to scan if no shop (or if we want all shops?)
                 # For this app, we probably only want the current shop's history if logged in.
-                response = self.sales_table.scan(Limit=limit)
-                items = response.get('Items', [])
-            
-            # Map to format expected by UI if possible or just return clean dicts
-            results = []
-            for item in items:
-                # Convert back to simple types
-                results.append({
-                    'Data': time.strftime('%Y-%m-%d', time.localtime(float(item['timestamp']))),
-                    'Horario': time.strftime('%H:%M:%S', time.localtime(float(item['timestamp']))),
-                    'Preco Final': float(item.get('final_price', 0)),
-                    'Metodo de pagamento': item.get('payment_method', ''),
-                    'Produtos': item.get('products_json', '{}'),
-                    'Shop': item.get('shop_name', '')
-                })
-            return results
+                read = self.sales_table.scan
+
+            filters = []
+            if payment_method:
+                filters.append(boto3.dynamodb.conditions.Attr('payment_method').eq(payment_method))
+            if not shop_name and start:
+                filters.append(boto3.dynamodb.conditions.Attr('timestamp').gte(start))
+            if not shop_name and end:
+                filters.append(boto3.dynamodb.conditions.Attr('timestamp').lt(end))
+            if filters:
+                expr = filters[0]
+                for f in filters[1:]:
+                    expr = expr & f
+                kwargs['FilterExpression'] = expr
+
+            items = []
+            while len(items) < limit:
+                kwargs['Limit'] = limit - len(items)
+                if cursor:
+                    kwargs['ExclusiveStartKey'] = cursor
+                response = read(**kwargs)
+                items.extend(response.get('Items', []))
+                cursor = response.get('LastEvaluatedKey')
+                if not cursor:
+                    break
+
+            return [self._sale_item_to_history(item) for item in items], cursor
         except Exception as e:
             print(f"Error fetching filtered sales history: {e}")
-            return []
+            return [], None
+
+    def _sale_item_to_history(self, item):
+        # Older rows store epoch seconds, newer ones the local 'YYYY-MM-DD HH:MM:SS.ffffff' string
+        ts = item['timestamp']
+        try:
+            dt = datetime.fromtimestamp(float(ts))
+        except ValueError:
+            dt = datetime.strptime(ts.split('.')[0], '%Y-%m-%d %H:%M:%S')
+        return {
+            'Data': dt.strftime('%Y-%m-%d'),
+            'Horario': dt.strftime('%H:%M:%S'),
+            'Preco Final': float(item.get('final_price', 0)),
+            'Metodo de pagamento': item.get('payment_method', ''),
+            'Produtos': item.get('products_json', '{}'),
+            'Shop': item.get('shop_name', ''),
+            'timestamp': ts
+        }
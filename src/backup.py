@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+
+class DatabaseBackup:
+    """
+    Online backups of the local database (the only copy of unsynced sales).
+
+    Pages are copied with sqlite3.Connection.backup a few at a time, pausing
+    between steps, from a dedicated connection that holds a read transaction
+    for the whole copy. Under WAL that pins a snapshot: writers (checkout,
+    sync) keep committing, and the copy doesn't restart every time they do.
+
+    Each snapshot is written to a .tmp file, checked with PRAGMA integrity_check
+    on this background thread, and only then renamed into
+    <db dir>/backups/database_YYYYmmdd-HHMMSS.db. The newest `keep` are kept.
+    """
+
+    def __init__(self, db, backup_dir=None, keep=7, pages=16, pause=0.005):
+        self.db = db
+        self.backup_dir = backup_dir or os.path.join(os.path.dirname(os.path.abspath(db.db_path)), 'backups')
+        self.keep = keep
+        self.pages = pages
+        self.pause = pause
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def snapshots(self):
+        """Verified snapshot paths, newest first."""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        names = [n for n in os.listdir(self.backup_dir) if n.startswith('database_') and n.endswith('.db')]
+        return [os.path.join(self.backup_dir, n) for n in sorted(names, reverse=True)]
+
+    def run(self):
+        """Takes one snapshot. Returns its path, or None if it failed verification."""
+        with self.lock:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            name = f"database_{datetime.now().strftime('%Y%m%d-%H%M%S')}.db"
+            path = os.path.join(self.backup_dir, name)
+            tmp_path = path + '.tmp'
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+            started = time.perf_counter()
+            src = sqlite3.connect(self.db.db_path, isolation_level=None)
+            dst = sqlite3.connect(tmp_path)
+            try:
+                src.execute("BEGIN")
+                src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+                src.backup(dst, pages=self.pages, progress=self._step)
+                src.execute("COMMIT")
+            finally:
+                dst.close()
+                src.close()
+
+            if not self.verify(tmp_path):
+                print(f"Backup failed integrity check, discarded: {tmp_path}")
+                os.remove(tmp_path)
+                return None
+
+            os.replace(tmp_path, path)
+            self.rotate()
+            self.db.set_config('last_backup', path)
+            print(f"Backup saved: {path} ({time.perf_counter() - started:.1f}s)")
+            return path
+
+    def _step(self, status, remaining, total):
+        # Yield between steps so the copy trickles along beside checkout
+        if self.pause:
+            time.sleep(self.pause)
+
+    def verify(self, path):
+        conn = sqlite3.connect(path)
+        try:
+            rows = conn.execute("PRAGMA integrity_check").fetchall()
+            return rows == [('ok',)]
+        except sqlite3.Error as e:
+            print(f"Error verifying backup {path}: {e}")
+            return False
+        finally:
+            conn.close()
+
+    def rotate(self):
+        for old in self.snapshots()[self.keep:]:
+            try:
+                os.remove(old)
+            except OSError as e:
+                print(f"Error removing old backup {old}: {e}")
+
+    def start(self, interval=3600):
+        """Backs up every `interval` seconds on a daemon thread (first one right away)."""
+        if self.thread and self.thread.is_alive():
+            return
+
+        def loop():
+            while not self.stop_event.is_set():
+                try:
+                    self.run()
+                except (sqlite3.Error, OSError) as e:
+                    print(f"Backup error: {e}")
+                self.stop_event.wait(interval)
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=loop, name="DatabaseBackup", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,44 @@
+"""
+GTIN helpers. EAN-8, UPC-A (12), EAN-13 and GTIN-14 are the same number
+space once left-padded with zeros to 14 digits, so a product registered as
+UPC-A '012345678905' and scanned as EAN-13 '0012345678905' share one key.
+"""
+
+GTIN_LENGTHS = (8, 12, 13, 14)
+
+
+def gtin_check_digit(body):
+    """Check digit for the digits before it (GS1 mod-10, weights 3/1 from the right)."""
+    # Summing the ASCII bytes is much cheaper than int() per digit; take the '0's back out
+    odd, even = body[-1::-2].encode('ascii'), body[-2::-2].encode('ascii')
+    total = 3 * (sum(odd) - 48 * len(odd)) + sum(even) - 48 * len(even)
+    return str(-total % 10)
+
+
+def is_valid_gtin(code):
+    return (
+        isinstance(code, str)
+        # isdigit() alone lets other scripts' digits through, which gtin_check_digit can't sum
+        and code.isascii()
+        and code.isdigit()
+        and len(code) in GTIN_LENGTHS
+        and gtin_check_digit(code[:-1]) == code[-1]
+    )
+
+
+def canonical_gtin(code):
+    """
+    14-digit canonical form of a valid GTIN, or None if code isn't one
+    (internal codes, typos, bad check digit) - those only match exactly.
+    """
+    if code is None:
+        return None
+    code = str(code).strip()
+    if not is_valid_gtin(code):
+        return None
+    return code.zfill(14)
+
+
+def barcode_key(code):
+    """Lookup key: the canonical GTIN when there is one, else the code itself."""
+    return canonical_gtin(code) or code
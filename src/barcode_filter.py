@@ -0,0 +1,84 @@
+import hashlib
+import math
+import os
+import struct
+
+from src.barcode import barcode_key
+
+MAGIC = b'SBLOOM01'
+# magic, catalog generation, bit count, hash count
+HEADER = struct.Struct('<8sqQI4x')
+
+
+class BarcodeFilter:
+    """
+    Bloom filter of the known barcodes (by src.barcode.barcode_key, so every
+    GTIN form of a code agrees). `barcode in f` being False means the code is
+    definitely not in the catalog; True means it probably is, and the caller
+    goes on to the real lookup. Entries are never removed: a deleted product
+    only costs a false positive until the next rebuild.
+    """
+
+    def __init__(self, bits, hashes, generation=0, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.generation = generation
+        self.data = data if data is not None else bytearray((bits + 7) // 8)
+
+    @classmethod
+    def for_count(cls, count, fp_rate=0.01, generation=0):
+        """Sized for `count` barcodes at the given false positive rate."""
+        count = max(count, 1)
+        bits = max(64, int(-count * math.log(fp_rate) / (math.log(2) ** 2)))
+        hashes = max(1, round(bits / count * math.log(2)))
+        return cls(bits, hashes, generation)
+
+    @classmethod
+    def build(cls, barcodes, fp_rate=0.01, generation=0):
+        barcodes = [b for b in barcodes if b]
+        f = cls.for_count(len(barcodes), fp_rate, generation)
+        for barcode in barcodes:
+            f.add(barcode)
+        return f
+
+    def _positions(self, barcode):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(str(barcode_key(barcode)).encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def add(self, barcode):
+        if not barcode:
+            return
+        data = self.data
+        for pos in self._positions(barcode):
+            data[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, barcode):
+        if not barcode:
+            return False
+        data = self.data
+        for pos in self._positions(barcode):
+            if not data[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def save(self, path):
+        """Written to a temp file and renamed, like the catalog snapshot."""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, int(self.generation), self.bits, self.hashes))
+            f.write(self.data)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        magic, generation, bits, hashes = HEADER.unpack_from(raw, 0)
+        data = bytearray(raw[HEADER.size:])
+        if magic != MAGIC or len(data) != (bits + 7) // 8:
+            raise ValueError(f"Not a barcode filter: {path}")
+        return cls(bits, hashes, generation, data)
@@ -0,0 +1,98 @@
+import threading
+
+from src.barcode import barcode_key
+
+# Products are held as tuples in this order (the keys of Database._row_to_dict)
+FIELDS = ('product_id', 'barcode', 'marca', 'categoria', 'sabor', 'preco', 'sync_status')
+
+
+class CatalogIndex:
+    """
+    In-process index of the local catalog for ONE shop.
+    Holds the resolved product dicts (same shape as Database._row_to_dict)
+    keyed by product_id and by barcode, so a scan is a dictionary lookup.
+    Barcodes are keyed by src.barcode.barcode_key, so UPC-A/EAN-13 forms of
+    one GTIN land on the same entry.
+    The Database keeps it coherent by writing through on every product write.
+    Rows are stored as FIELDS tuples and handed out as fresh dicts, which is
+    what lets load_rows fill it from a catalog snapshot without building a
+    dict per product.
+    """
+
+    def __init__(self, shop_name):
+        self.shop_name = shop_name
+        self.ready = False
+        self.lock = threading.RLock()
+        self._by_id = {}
+        self._by_barcode = {}
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def covers(self, shop_name):
+        """True if lookups for shop_name can be answered from memory."""
+        return self.ready and shop_name == self.shop_name
+
+    def load(self, products):
+        """Replaces the whole index with the given product dicts."""
+        rows = [tuple(p.get(f) for f in FIELDS) for p in products]
+        self.load_rows(rows, [barcode_key(row[1]) for row in rows])
+
+    def load_rows(self, rows, keys):
+        """Replaces the whole index with FIELDS tuples and their barcode_keys (see CatalogSnapshot.rows)."""
+        with self.lock:
+            self._by_id = {row[0]: row for row in rows}
+            by_barcode = {}
+            for row, key in zip(rows, keys):
+                ids = by_barcode.get(key)
+                if ids is None:
+                    by_barcode[key] = {row[0]: None}
+                else:
+                    ids[row[0]] = None
+            self._by_barcode = by_barcode
+            self.ready = True
+
+    def get(self, product_id):
+        row = self._by_id.get(product_id)
+        return dict(zip(FIELDS, row)) if row else None
+
+    def find_barcode(self, barcode):
+        ids = list(self._by_barcode.get(barcode_key(barcode), ()))
+        return [dict(zip(FIELDS, row)) for row in map(self._by_id.get, ids) if row]
+
+    def put(self, product):
+        with self.lock:
+            self.remove(product['product_id'])
+            self._add(product)
+
+    def remove(self, product_id):
+        with self.lock:
+            old = self._by_id.pop(product_id, None)
+            if old is not None:
+                key = barcode_key(old[1])
+                ids = self._by_barcode.get(key)
+                if ids:
+                    ids.pop(product_id, None)
+                    if not ids:
+                        del self._by_barcode[key]
+
+    def _exact(self, barcode):
+        # Writes by barcode (delete, mark synced) match it exactly, like the SQL does
+        ids = self._by_barcode.get(barcode_key(barcode), ())
+        return [pid for pid in ids if self._by_id[pid][1] == barcode]
+
+    def remove_barcode(self, barcode):
+        with self.lock:
+            for pid in self._exact(barcode):
+                self.remove(pid)
+
+    def set_sync_status(self, barcode, status):
+        with self.lock:
+            for pid in self._exact(barcode):
+                row = self._by_id[pid]
+                self._by_id[pid] = row[:6] + (status,)
+
+    def _add(self, product):
+        row = tuple(product.get(f) for f in FIELDS)
+        self._by_id[row[0]] = row
+        self._by_barcode.setdefault(barcode_key(row[1]), {})[row[0]] = None
@@ -0,0 +1,189 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from src.barcode import barcode_key
+
+MAGIC = b'SCATLG03'
+# magic, byte order ('l'/'b'), generation, row count, shop name length
+HEADER = struct.Struct('<8scxxxqIIxxxx')
+STRING_COLUMNS = ('product_id', 'barcode', 'marca', 'categoria', 'sabor', 'sync_status')
+
+
+def _pad(n):
+    return (8 - n % 8) % 8
+
+
+def _lower_bound(count, key, key_at):
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if key_at(mid) < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _write_strings(f, strings):
+    # NUL-terminated: offsets give random access, split('\0') decodes a whole column at once
+    count = len(strings)
+    offsets = array('I', [0])
+    for string in strings:
+        offsets.append(offsets[-1] + len(string) + 1)
+    blob = b''.join(string + b'\0' for string in strings)
+    f.write(offsets.tobytes())
+    f.write(blob + b'\0' * _pad(len(blob) + 4 * (count + 1)))
+
+
+def write_snapshot(path, shop_name, generation, products):
+    """
+    Writes the resolved catalog of one shop (dicts shaped like
+    Database._row_to_dict) as a columnar file:
+
+        header | shop name | preco: float64[n]
+        | per string column: offsets uint32[n + 1] + NUL-terminated utf-8 blob
+        | barcode order: uint32[n]
+        | barcode keys in barcode order: offsets uint32[n + 1] + blob
+
+    Rows are sorted by product_id and barcode order is a permutation sorted
+    by barcode_key(barcode), stored alongside, so both lookups are binary
+    searches on the mapped file that never compute a key.
+    Written to a temp file and renamed, so a reader never sees half a file.
+    """
+    rows = sorted(
+        ([str(p.get(c) or '').replace('\0', '').encode('utf-8') for c in STRING_COLUMNS], float(p.get('preco') or 0.0))
+        for p in products
+    )
+    count = len(rows)
+    shop_bytes = shop_name.encode('utf-8')
+    keys = [barcode_key(strings[1].decode('utf-8')).encode('utf-8') for strings, _ in rows]
+    barcode_order = sorted(range(count), key=keys.__getitem__)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, sys.byteorder[0].encode(), int(generation), count, len(shop_bytes)))
+        f.write(shop_bytes + b'\0' * _pad(len(shop_bytes)))
+        f.write(array('d', (price for _, price in rows)).tobytes())
+        for col in range(len(STRING_COLUMNS)):
+            _write_strings(f, [strings[col] for strings, _ in rows])
+        f.write(array('I', barcode_order).tobytes())
+        if count % 2:
+            f.write(b'\0' * 4)
+        _write_strings(f, [keys[i] for i in barcode_order])
+    os.replace(tmp_path, path)
+
+
+class CatalogSnapshot:
+    """
+    Read-only, memory-mapped view of a file written by write_snapshot.
+    Opening it only parses the header and section offsets; rows are decoded
+    on lookup, so it is usable right after launch however big the catalog.
+    get/find_barcode return the same dicts as CatalogIndex, and rows()
+    decodes the whole file in one pass to fill a CatalogIndex.
+
+    Other threads may be mid-lookup on a published snapshot, so it isn't
+    closed to replace it: drop the reference and the map goes away with
+    the last reader.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # The map keeps its own handle, the file isn't needed past this
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty file
+                raise ValueError(f"Empty catalog snapshot: {path}")
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def _parse(self):
+        buf = memoryview(self._map)
+        magic, order, self.generation, self.count, shop_len = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or order != sys.byteorder[0].encode():
+            raise ValueError(f"Not a catalog snapshot for this machine: {self.path}")
+        pos = HEADER.size
+        self.shop_name = bytes(buf[pos:pos + shop_len]).decode('utf-8')
+        pos += shop_len + _pad(shop_len)
+
+        n = self.count
+        self._prices = buf[pos:pos + 8 * n].cast('d')
+        pos += 8 * n
+        self._columns = []
+        for _ in STRING_COLUMNS:
+            pos = self._parse_strings(buf, pos, self._columns)
+        self._barcode_order = buf[pos:pos + 4 * n].cast('I')
+        pos += 4 * n + _pad(4 * n)
+        keys = []
+        self._parse_strings(buf, pos, keys)
+        self._keys = keys[0]
+
+    def _parse_strings(self, buf, pos, out):
+        n = self.count
+        offsets = buf[pos:pos + 4 * (n + 1)].cast('I')
+        pos += 4 * (n + 1)
+        size = offsets[n]
+        out.append((offsets, buf[pos:pos + size]))
+        return pos + size + _pad(size + 4 * (n + 1))
+
+    def close(self):
+        # Only for a snapshot nobody else holds. Views into the map must go before it can be closed
+        self._prices = self._columns = self._barcode_order = self._keys = None
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+
+    def __len__(self):
+        return self.count
+
+    def _string(self, col, i):
+        offsets, blob = self._columns[col]
+        return bytes(blob[offsets[i]:offsets[i + 1] - 1])
+
+    def _key(self, j):
+        offsets, blob = self._keys
+        return bytes(blob[offsets[j]:offsets[j + 1] - 1])
+
+    def _row(self, i):
+        row = {name: self._string(col, i).decode('utf-8') for col, name in enumerate(STRING_COLUMNS)}
+        row['preco'] = self._prices[i]
+        return row
+
+    def get(self, product_id):
+        key = str(product_id).encode('utf-8')
+        i = _lower_bound(self.count, key, lambda j: self._string(0, j))
+        if i < self.count and self._string(0, i) == key:
+            return self._row(i)
+        return None
+
+    def find_barcode(self, barcode):
+        key = barcode_key(str(barcode)).encode('utf-8')
+        order = self._barcode_order
+        i = _lower_bound(self.count, key, self._key)
+        found = []
+        while i < self.count and self._key(i) == key:
+            found.append(self._row(order[i]))
+            i += 1
+        return found
+
+    def rows(self):
+        """
+        Every row as a src.catalog_index.FIELDS tuple, plus the barcode_key of
+        each in the same order: CatalogIndex.load_rows input. Each column is
+        decoded in one go, no per-row parsing.
+        """
+        product_id, barcode, marca, categoria, sabor, sync_status = (
+            bytes(blob).decode('utf-8').split('\0')[:-1] for _, blob in self._columns
+        )
+        rows = list(zip(product_id, barcode, marca, categoria, sabor, self._prices.tolist(), sync_status))
+        keys = [None] * self.count
+        sorted_keys = bytes(self._keys[1]).decode('utf-8').split('\0')[:-1]
+        for key, i in zip(sorted_keys, self._barcode_order.tolist()):
+            keys[i] = key
+        return rows, keys
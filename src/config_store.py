@@ -0,0 +1,122 @@
+import json
+import threading
+
+
+class ConfigStore:
+    """
+    In-memory copy of the `config` table, one per database file.
+    Loaded once; set() writes through to SQLite and then updates the copy,
+    so get() never touches disk. Subscribers are told about every change.
+    Values are stored as text, like the table; get_json/get_int/get_float
+    decode them for callers that want typed values.
+    Changes made by another process are only seen after reload().
+    """
+
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+    @classmethod
+    def for_database(cls, db):
+        with cls._stores_lock:
+            store = cls._stores.get(db.pool)
+            if store is None:
+                store = cls(db)
+                cls._stores[db.pool] = store
+            return store
+
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.RLock()
+        # Orders set() calls so the cache ends up with the last committed value
+        self._set_lock = threading.Lock()
+        self._values = None
+        self._subscribers = {}
+
+    def _loaded(self):
+        if self._values is None:
+            with self.lock:
+                if self._values is None:
+                    self.reload()
+        return self._values
+
+    def reload(self):
+        """Re-reads the whole table (it holds a handful of rows)."""
+        with self.db.get_connection() as conn:
+            rows = conn.execute("SELECT key, value FROM config").fetchall()
+        with self.lock:
+            first_load = self._values is None
+            old = self._values or {}
+            self._values = dict(rows)
+            changed = [k for k in set(old) | set(self._values) if old.get(k) != self._values.get(k)]
+        if not first_load:
+            for key in changed:
+                self._notify(key, self._values.get(key))
+
+    def get(self, key, default=None):
+        return self._loaded().get(key, default)
+
+    def get_json(self, key, default=None):
+        val = self.get(key)
+        if not val:
+            return default
+        try:
+            return json.loads(val)
+        except (TypeError, ValueError):
+            return default
+
+    def get_int(self, key, default=None):
+        try:
+            return int(self.get(key))
+        except (TypeError, ValueError):
+            return default
+
+    def get_float(self, key, default=None):
+        try:
+            return float(self.get(key))
+        except (TypeError, ValueError):
+            return default
+
+    def set(self, key, value):
+        """Writes through to SQLite; the cache only changes once the row is committed."""
+        # Not under self.lock: a writer that already holds SQLite's write lock
+        # may be waiting for it (lock order is always SQLite first, then self.lock)
+        with self._set_lock:
+            with self.db.get_connection() as conn:
+                conn.execute("INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)", (key, value))
+            self.written(key, value)
+
+    def set_json(self, key, value):
+        self.set(key, json.dumps(value))
+
+    def written(self, key, value):
+        """Records a value the caller already committed in its own transaction."""
+        with self.lock:
+            values = self._loaded()
+            if key in values and values[key] == value:
+                return
+            values[key] = value
+        self._notify(key, value)
+
+    def subscribe(self, callback, key=None):
+        """
+        callback(key, value) after each change of key (or of any key if None).
+        Runs on the thread that made the change. Returns an unsubscribe function.
+        """
+        with self.lock:
+            self._subscribers.setdefault(key, []).append(callback)
+
+        def unsubscribe():
+            with self.lock:
+                callbacks = self._subscribers.get(key, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+        return unsubscribe
+
+    def _notify(self, key, value):
+        with self.lock:
+            callbacks = self._subscribers.get(key, []) + self._subscribers.get(None, [])
+        for callback in callbacks:
+            try:
+                callback(key, value)
+            except Exception as e:
+                print(f"Error in config subscriber for '{key}': {e}")
@@ -3,116 +3,720 @@ import sqlite3
 import json
 from datetime import datetime
 import os
+import re
+import struct
+import threading
+import time
+
+from src.catalog_index import CatalogIndex
+from src.sale_writer import SaleWriter
+from src.config_store import ConfigStore
+from src.sales_archive import SalesArchiver
+from src.catalog_snapshot import CatalogSnapshot, write_snapshot
+from src.barcode import canonical_gtin
+from src.barcode_filter import BarcodeFilter
+from src.product_cache import ProductCache
+
+
+class ConnectionPool:
+    """
+    Keeps one long-lived connection per thread for a given database file.
+    The UI thread, the sync thread and the sale threads each reuse their own
+    connection instead of paying connect/close on every query.
+    Connections are opened in WAL mode so readers never block the writer.
+    """
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, db_path, timeout=10.0):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def for_path(cls, db_path):
+        """Returns the shared pool for db_path (one per database file)."""
+        key = db_path if db_path == ':memory:' else os.path.abspath(db_path)
+        with cls._pools_lock:
+            pool = cls._pools.get(key)
+            if pool is None:
+                pool = cls(db_path)
+                cls._pools[key] = pool
+            return pool
+
+    def get(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.Error as e:
+            # Some filesystems (network shares) don't support WAL, keep the default journal
+            print(f"Could not enable WAL mode: {e}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+        # INSERT OR REPLACE must fire the DELETE triggers that keep products_fts in sync
+        conn.execute("PRAGMA recursive_triggers=ON")
+        return conn
+
+    def close(self):
+        """Closes the calling thread's connection (if any)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+
+
+# --- Schema Migrations ---
+# Ordered list: MIGRATIONS[i] upgrades a database from user_version i to i + 1.
+# Append new steps at the end, never edit or reorder the released ones.
+
+def _migrate_base_schema(conn):
+    """
+    v1: sales, config and products tables.
+    Databases created before versioning (user_version 0) may be any of the
+    historical layouts, so missing columns are added here once.
+    """
+    # Create SALES table (Legacy compatible)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sales (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            final_price REAL,
+            payment_method TEXT,
+            products_json TEXT,
+            sync_status TEXT DEFAULT 'pending'
+        );
+    """)
+
+    # CONFIG table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS config (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """)
+
+    # PRODUCTS table (V3 Cache)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            product_id TEXT PRIMARY KEY,
+            barcode TEXT,
+            brand TEXT,
+            category TEXT,
+            flavor TEXT,
+            price REAL,
+            prices_json TEXT DEFAULT '{}',
+            metadata_json TEXT,
+            sync_status TEXT DEFAULT 'synced'
+        );
+    """)
+    columns = [info[1] for info in conn.execute("PRAGMA table_info(products)")]
+    # Migration 3.1
+    if 'sync_status' not in columns:
+        conn.execute("ALTER TABLE products ADD COLUMN sync_status TEXT DEFAULT 'synced'")
+    # Migration 3.2 - Multi-shop cache
+    if 'prices_json' not in columns:
+        conn.execute("ALTER TABLE products ADD COLUMN prices_json TEXT DEFAULT '{}'")
+
+    # Index for barcode search
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_barcode ON products(barcode)")
+
+    # Migration 3.3
+    s_columns = [info[1] for info in conn.execute("PRAGMA table_info(sales)")]
+    if 'sync_status' not in s_columns:
+        conn.execute("ALTER TABLE sales ADD COLUMN sync_status TEXT DEFAULT 'synced'") # Old sales assumed synced
+
+
+def _migrate_products_fts(conn):
+    """
+    v2: products_fts, an FTS5 index over barcode/brand/category/flavor.
+    The unicode61 tokenizer folds accents on both the stored text and the query,
+    and the triggers keep it in sync with every write to products.
+    Skipped if this SQLite build has no FTS5 (search falls back to LIKE).
+    """
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'").fetchone()
+    try:
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                barcode, brand, category, flavor,
+                content='products', content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2'
+            );
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"FTS5 unavailable, using LIKE search: {e}")
+        return
+
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts(rowid, barcode, brand, category, flavor)
+            VALUES (new.rowid, new.barcode, new.brand, new.category, new.flavor);
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, barcode, brand, category, flavor)
+            VALUES ('delete', old.rowid, old.barcode, old.brand, old.category, old.flavor);
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF barcode, brand, category, flavor ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, barcode, brand, category, flavor)
+            VALUES ('delete', old.rowid, old.barcode, old.brand, old.category, old.flavor);
+            INSERT INTO products_fts(rowid, barcode, brand, category, flavor)
+            VALUES (new.rowid, new.barcode, new.brand, new.category, new.flavor);
+        END;
+    """)
+    if not exists:
+        # Index products cached before the FTS table existed
+        conn.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+
+def _migrate_product_prices(conn):
+    """
+    v3: product_prices(product_id, shop, price), replacing the prices_json blob.
+    Existing blobs are unpacked into it with json_each.
+    """
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'product_prices'").fetchone()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS product_prices (
+            product_id TEXT NOT NULL,
+            shop TEXT NOT NULL,
+            price REAL,
+            PRIMARY KEY (product_id, shop)
+        ) WITHOUT ROWID;
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_product_prices_shop ON product_prices(shop, product_id)")
+    if not exists:
+        conn.execute("""
+            INSERT OR REPLACE INTO product_prices (product_id, shop, price)
+            SELECT p.product_id, j.key, CAST(j.value AS REAL)
+            FROM products p, json_each(p.prices_json) j
+            WHERE json_valid(p.prices_json) AND json_type(p.prices_json) = 'object'
+        """)
+
+
+def _migrate_sale_items(conn):
+    """
+    v4: sales keyed by the app's Sale.id (UUID) plus a sale_items child table.
+    Legacy rows get a generated UUID and their products_json is unpacked into sale_items.
+    products_json is kept on sales as the payload uploaded to the cloud.
+    """
+    conn.execute("ALTER TABLE sales RENAME TO sales_legacy")
+    conn.execute("""
+        CREATE TABLE sales (
+            sale_id TEXT PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            final_price REAL,
+            payment_method TEXT,
+            products_json TEXT,
+            sync_status TEXT DEFAULT 'pending'
+        );
+    """)
+    conn.execute("""
+        INSERT INTO sales (sale_id, timestamp, final_price, payment_method, products_json, sync_status)
+        SELECT lower(hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-4' || substr(hex(randomblob(2)), 2) || '-'
+                     || substr('89ab', 1 + abs(random()) % 4, 1) || substr(hex(randomblob(2)), 2) || '-' || hex(randomblob(6))),
+               COALESCE(timestamp, CURRENT_TIMESTAMP), final_price, payment_method, products_json, sync_status
+        FROM sales_legacy ORDER BY id
+    """)
+    conn.execute("DROP TABLE sales_legacy")
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sale_items (
+            sale_id TEXT NOT NULL,
+            product_id TEXT NOT NULL,
+            category TEXT,
+            flavor TEXT,
+            price REAL,
+            quantity INTEGER,
+            PRIMARY KEY (sale_id, product_id)
+        ) WITHOUT ROWID;
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO sale_items (sale_id, product_id, category, flavor, price, quantity)
+        SELECT s.sale_id, j.key,
+               json_extract(j.value, '$.categoria'), json_extract(j.value, '$.sabor'),
+               json_extract(j.value, '$.preco'), json_extract(j.value, '$.quantidade')
+        FROM sales s, json_each(s.products_json) j
+        WHERE json_valid(s.products_json) AND json_type(s.products_json) = 'object'
+          AND json_type(j.value) = 'object'
+    """)
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_timestamp ON sales(timestamp)")
+    # Only the handful of rows waiting for upload are indexed
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_unsynced ON sales(timestamp) WHERE sync_status IS NOT 'synced'")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sale_items_product ON sale_items(product_id)")
+
+
+def _migrate_sales_report_index(conn):
+    """
+    v5: covering index for src.reports. Totals by day/hour/payment method
+    are answered from the index alone, without touching the sales rows.
+    """
+    conn.execute("DROP INDEX IF EXISTS idx_sales_timestamp")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_report ON sales(timestamp, payment_method, final_price)")
+
+
+def _migrate_sales_history_keyset(conn):
+    """
+    v6: sale_id added to idx_sales_report right after timestamp, so the
+    (timestamp, sale_id) keyset used by get_sales_page is an index seek
+    with no sort step. The report queries stay covered.
+    """
+    conn.execute("DROP INDEX IF EXISTS idx_sales_report")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_report ON sales(timestamp, sale_id, payment_method, final_price)")
+
+
+def _migrate_shop_catalog(conn):
+    """
+    v7: shop_catalog, the prices of product_prices already resolved for one
+    shop (config 'catalog_shop', the POS's current shop). Reads for that shop
+    join it once on the primary key instead of twice on product_prices.
+    Database fills it when the shop changes and refreshes the touched rows on
+    every product write, like the catalog index.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS shop_catalog (
+            product_id TEXT PRIMARY KEY,
+            price REAL NOT NULL
+        ) WITHOUT ROWID;
+    """)
+
+
+def _migrate_sales_summary(conn):
+    """
+    v8: running aggregates of sales moved out to the monthly archive files
+    (src.sales_archive), so reports keep covering them without attaching anything.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sales_summary (
+            day TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            payment_method TEXT NOT NULL,
+            sales INTEGER NOT NULL,
+            total REAL NOT NULL,
+            PRIMARY KEY (day, hour, payment_method)
+        ) WITHOUT ROWID;
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sale_items_summary (
+            day TEXT NOT NULL,
+            product_id TEXT NOT NULL,
+            category TEXT,
+            flavor TEXT,
+            sales INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            total REAL NOT NULL,
+            PRIMARY KEY (day, product_id)
+        ) WITHOUT ROWID;
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sale_items_summary_product ON sale_items_summary(product_id)")
+
+
+def _migrate_products_gtin(conn):
+    """
+    v9: products.gtin, the barcode as a 14-digit GTIN (src.barcode.canonical_gtin),
+    so the same item scanned as UPC-A or EAN-13 finds one product. NULL for
+    codes that aren't valid GTINs; those are still looked up by barcode.
+    """
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(products)")]
+    if 'gtin' not in columns:
+        conn.execute("ALTER TABLE products ADD COLUMN gtin TEXT")
+    rows = conn.execute("SELECT product_id, barcode FROM products").fetchall()
+    conn.executemany(
+        "UPDATE products SET gtin = ? WHERE product_id = ?",
+        [(canonical_gtin(barcode), pid) for pid, barcode in rows]
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_products_gtin ON products(gtin)")
+
+
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_products_fts,
+    _migrate_product_prices,
+    _migrate_sale_items,
+    _migrate_sales_report_index,
+    _migrate_sales_history_keyset,
+    _migrate_shop_catalog,
+    _migrate_sales_summary,
+    _migrate_products_gtin,
+]
+
+
+def run_migrations(conn):
+    """
+    Applies every pending migration, each in its own IMMEDIATE transaction
+    together with its user_version bump. The version is re-read under the
+    write lock, so two processes opening an old database at once don't
+    apply the same step twice.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    for target, migration in enumerate(MIGRATIONS, start=1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = conn.execute("PRAGMA user_version").fetchone()[0]
+            if current < target:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
 
 class Database:
     def __init__(self, db_path='database.db'):
         self.db_path = db_path
+        self.pool = ConnectionPool.for_path(db_path)
+        self.catalog_index = None
+        self.catalog_snapshot = None
+        self.barcode_filter = None
+        self.barcode_filter_lock = threading.Lock()
+        self.product_cache = ProductCache()
+        self.fts_enabled = True
         self.init_db()
+        self.config = ConfigStore.for_database(self)
+        self.archiver = SalesArchiver(self) if db_path != ':memory:' else None
 
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        """
+        Returns this thread's persistent connection.
+        Use it as `with self.get_connection() as conn:` - the block commits
+        (or rolls back) but does not close the connection.
+        """
+        return self.pool.get()
 
-    def init_db(self):
-        # We are moving to V3. If we detect old tables, we might want to drop them or just ignore.
-        # Ideally, for a clean offline cache, we can just recreate the products table.
+    def close(self):
+        self.pool.close()
+
+    # --- In-memory Catalog Index ---
+
+    def enable_catalog_index(self, shop_name):
+        """
+        Loads every cached product resolved for shop_name into memory.
+        Barcode and product_id lookups for that shop are then served from the index.
+        Filled straight from the mapped catalog snapshot when that is current
+        (one pass over the file), else from SQL.
+        Safe to call from a background thread: reads fall back to SQL until it is ready.
+        """
+        if self.get_config('catalog_shop') != shop_name:
+            self.build_shop_catalog(shop_name)
+        if self._fresh_snapshot(shop_name) is None:
+            self.open_catalog_snapshot(shop_name)
+        snapshot = self.catalog_snapshot
+        index = CatalogIndex(shop_name)
+        self.catalog_index = index
+        with index.lock:
+            try:
+                with self.get_connection() as conn:
+                    # Committed generation, not the cached one: a writer may not have published yet
+                    generation = conn.execute("SELECT value FROM config WHERE key = 'catalog_generation'").fetchone()
+                    if snapshot is not None and snapshot.shop_name == shop_name and str(snapshot.generation) == (generation[0] if generation else '0'):
+                        index.load_rows(*snapshot.rows())
+                    else:
+                        sql, params = self._product_select(shop_name)
+                        rows = conn.execute(sql, params).fetchall()
+                        index.load(self._row_to_dict(r) for r in rows)
+            except sqlite3.Error as e:
+                print(f"Error loading catalog index: {e}")
+                self.catalog_index = None
+        if self._fresh_snapshot(shop_name) is None:
+            # Next launch starts from a current snapshot
+            self.write_catalog_snapshot(shop_name)
+        return index
+
+    def disable_catalog_index(self):
+        self.catalog_index = None
+
+    # --- Catalog Snapshot ---
+    # A memory-mapped columnar copy of one shop's resolved catalog
+    # (src.catalog_snapshot) that enable_catalog_index fills the index from
+    # in one pass instead of querying every product. Single lookups don't go
+    # through it: SQL on the gtin/primary key indexes is as fast as a binary
+    # search in Python. Every product write bumps config 'catalog_generation';
+    # a snapshot taken at another generation is stale and isn't used.
+    # Each write goes to a new catalog.<time_ns>.snap and
+    # the reference is swapped, so a lookup holding the old map keeps working;
+    # files of older snapshots are removed once they can be.
+
+    def _catalog_snapshot_files(self):
+        """Snapshot files next to the DB, newest first."""
+        folder = os.path.dirname(os.path.abspath(self.db_path))
+        try:
+            names = os.listdir(folder)
+        except OSError:
+            return []
+        found = []
+        for name in names:
+            match = re.fullmatch(r'catalog\.(\d+)\.snap', name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(folder, name)))
+        return [path for _, path in sorted(found, reverse=True)]
+
+    def catalog_snapshot_path(self):
+        """Path of the newest snapshot file, or None."""
+        files = self._catalog_snapshot_files()
+        return files[0] if files else None
+
+    def _remove_old_snapshots(self, keep):
+        folder = os.path.dirname(os.path.abspath(self.db_path))
+        # catalog.snap is the single file older versions rewrote in place
+        for path in self._catalog_snapshot_files() + [os.path.join(folder, 'catalog.snap')]:
+            if path == keep or not os.path.exists(path):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                # Still mapped here (Windows): next write gets it
+                pass
+
+    def _bump_catalog_generation(self, conn):
+        """
+        Runs inside the caller's transaction and returns the new generation.
+        The caller hands it to _catalog_generation_committed once the
+        transaction commits: the config cache is never touched while this
+        connection holds the write lock (ConfigStore.set takes them the other way).
+        """
+        conn.execute("""
+            INSERT INTO config (key, value) VALUES ('catalog_generation', '1')
+            ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+        """)
+        value = conn.execute("SELECT value FROM config WHERE key = 'catalog_generation'").fetchone()[0]
+        self.product_cache.clear()
+        return str(value)
+
+    def _catalog_generation_committed(self, generation):
+        # Writers can commit and get here out of order: the cached value only moves forward
+        with self.config.lock:
+            if int(generation) > (self.config.get_int('catalog_generation') or 0):
+                self.config.written('catalog_generation', generation)
+
+    def _fresh_snapshot(self, shop_name):
+        snapshot = self.catalog_snapshot
+        if snapshot is None or snapshot.shop_name != shop_name:
+            return None
+        if str(snapshot.generation) != (self.get_config('catalog_generation') or '0'):
+            return None
+        return snapshot
+
+    def catalog_snapshot_stale(self, shop_name):
+        return self._fresh_snapshot(shop_name) is None
+
+    def open_catalog_snapshot(self, shop_name, path=None):
+        """Maps the newest snapshot file (or path) if it is for shop_name and current. Returns True if so."""
+        if self.db_path == ':memory:':
+            return False
+        path = path or self.catalog_snapshot_path()
+        if path is None:
+            return False
+        current = self.catalog_snapshot
+        if current is None or current.path != path:
+            try:
+                # Swapped, never closed: lookups on the old one finish on its map
+                self.catalog_snapshot = CatalogSnapshot(path)
+            except (OSError, ValueError) as e:
+                print(f"Error opening catalog snapshot: {e}")
+                return False
+        return self._fresh_snapshot(shop_name) is not None
+
+    def write_catalog_snapshot(self, shop_name):
+        """Writes the snapshot of shop_name's catalog at the current generation and maps it."""
+        if self.db_path == ':memory:':
+            return False
+        try:
+            conn = self.get_connection()
+            # Generation and rows from the same read transaction
+            conn.execute("BEGIN")
+            try:
+                generation = conn.execute("SELECT value FROM config WHERE key = 'catalog_generation'").fetchone()
+                sql, params = self._product_select(shop_name)
+                products = [self._row_to_dict(r) for r in conn.execute(sql, params)]
+            finally:
+                conn.commit()
+            # A new file every time: the mapped one can't be replaced under its readers
+            folder = os.path.dirname(os.path.abspath(self.db_path))
+            path = os.path.join(folder, f'catalog.{time.time_ns()}.snap')
+            write_snapshot(path, shop_name, int(generation[0]) if generation else 0, products)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error writing catalog snapshot: {e}")
+            return False
+        fresh = self.open_catalog_snapshot(shop_name, path)
+        self._remove_old_snapshots(keep=self.catalog_snapshot.path if self.catalog_snapshot else path)
+        return fresh
+
+    # --- Barcode Filter ---
+    # A Bloom filter of every cached barcode (src.barcode_filter), saved next
+    # to the DB, so a scan of an unknown code is turned down without a query.
+    # Product writes add to it in memory; the file carries the catalog
+    # generation it was built at and is rebuilt from SQL once it is stale.
+
+    def barcode_filter_path(self):
+        return os.path.join(os.path.dirname(os.path.abspath(self.db_path)), 'barcodes.bloom')
+
+    def might_have_barcode(self, barcode):
+        """False only if barcode is definitely not cached. True while no filter is loaded."""
+        barcode_filter = self.barcode_filter
+        return barcode_filter is None or barcode in barcode_filter
+
+    def barcode_filter_stale(self):
+        barcode_filter = self.barcode_filter
+        return barcode_filter is None or str(barcode_filter.generation) != (self.get_config('catalog_generation') or '0')
+
+    def open_barcode_filter(self):
+        """Loads the saved filter if it is current, otherwise rebuilds it. Returns the filter (or None)."""
+        path = self.barcode_filter_path()
+        if self.db_path != ':memory:' and os.path.exists(path):
+            # Same lock as the writers: one that commits before the check moves
+            # the generation on (we rebuild), one after it finds the filter installed
+            with self.barcode_filter_lock:
+                try:
+                    barcode_filter = BarcodeFilter.load(path)
+                except (OSError, ValueError, struct.error) as e:
+                    print(f"Error opening barcode filter: {e}")
+                else:
+                    if str(barcode_filter.generation) == (self.get_config('catalog_generation') or '0'):
+                        self.barcode_filter = barcode_filter
+                        return barcode_filter
+        return self.build_barcode_filter()
+
+    def build_barcode_filter(self):
+        """Rebuilds the filter from the products table and saves it."""
+        # Writers add to the filter after they commit, under the same lock, so
+        # nothing committed between the read and the swap is lost
+        with self.barcode_filter_lock:
+            try:
+                conn = self.get_connection()
+                conn.execute("BEGIN")
+                try:
+                    generation = conn.execute("SELECT value FROM config WHERE key = 'catalog_generation'").fetchone()
+                    barcodes = [r[0] for r in conn.execute("SELECT barcode FROM products")]
+                finally:
+                    conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error building barcode filter: {e}")
+                return None
+            barcode_filter = BarcodeFilter.build(barcodes, generation=int(generation[0]) if generation else 0)
+            self.barcode_filter = barcode_filter
+        if self.db_path != ':memory:':
+            try:
+                barcode_filter.save(self.barcode_filter_path())
+            except OSError as e:
+                print(f"Error saving barcode filter: {e}")
+        return barcode_filter
+
+    def _barcode_filter_add(self, barcodes):
+        # Checked under the lock: a first build/load in progress installs the
+        # filter before we get it, so the barcodes land in the new one
+        with self.barcode_filter_lock:
+            if self.barcode_filter is None:
+                return
+            for barcode in barcodes:
+                self.barcode_filter.add(barcode)
+
+    # --- Materialized Shop Catalog ---
+
+    def build_shop_catalog(self, shop_name):
+        """
+        Fills shop_catalog with every price resolved for shop_name and makes it
+        the catalog shop. From then on product writes keep it current.
+        """
         try:
             with self.get_connection() as conn:
-                # Create SALES table (Legacy compatible)
-                conn.execute("""
-                    CREATE TABLE IF NOT EXISTS sales (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        final_price REAL,
-                        payment_method TEXT,
-                        products_json TEXT,
-                        sync_status TEXT DEFAULT 'pending'
-                    );
-                """)
-                
-                # CONFIG table
-                conn.execute("""
-                    CREATE TABLE IF NOT EXISTS config (
-                        key TEXT PRIMARY KEY,
-                        value TEXT
-                    );
-                """)
+                self._build_shop_catalog(conn, shop_name)
+            self.config.written('catalog_shop', shop_name)
+        except sqlite3.Error as e:
+            print(f"Error building shop catalog: {e}")
 
-                # PRODUCTS table (V3 Cache - scoped to ONE shop)
-                # We assume we are on V3 or a fresh install.
-                # Remove aggressive "DROP TABLE" to prevent wiping valid databases that might just have a glitch or be in a transient state.
-                
-                # Check current schema to decide if migrations are needed
-                cursor = conn.execute("PRAGMA table_info(products)")
-                columns = [info[1] for info in cursor.fetchall()]
-
-                # Check for sync_status (Migration 3.1)
-                if 'sync_status' not in columns:
-                     # We can just alter table if product_id exists
-                     try:
-                         # Attempt to add column if table exists (will fail if dropped above, which is fine)
-                         conn.execute("ALTER TABLE products ADD COLUMN sync_status TEXT DEFAULT 'synced'")
-                     except:
-                         pass
+    def _shop_catalog_refresh(self, conn, product_ids):
+        """Write-through: re-resolves the given products' catalog shop price."""
+        shop_name = self.get_config('catalog_shop')
+        if not shop_name or not product_ids:
+            return
+        rows = [(pid,) for pid in product_ids]
+        conn.executemany("DELETE FROM shop_catalog WHERE product_id = ?", rows)
+        conn.executemany("""
+            INSERT INTO shop_catalog (product_id, price)
+            SELECT ?1, COALESCE(
+                (SELECT price FROM product_prices WHERE product_id = ?1 AND shop = ?2),
+                (SELECT price FROM product_prices WHERE product_id = ?1 AND shop = ?3))
+            WHERE EXISTS (SELECT 1 FROM product_prices WHERE product_id = ?1 AND shop IN (?2, ?3))
+        """, [(pid, shop_name, shop_name.replace(" ", "_")) for pid in product_ids])
 
-                conn.execute("""
-                    CREATE TABLE IF NOT EXISTS products (
-                        product_id TEXT PRIMARY KEY,
-                        barcode TEXT,
-                        brand TEXT,
-                        category TEXT,
-                        flavor TEXT,
-                        price REAL,
-                        metadata_json TEXT,
-                        sync_status TEXT DEFAULT 'synced'
-                    );
-                """)
-                # Check for prices_json (Migration 3.2 - Multi-shop cache)
-                if 'prices_json' not in columns:
-                     try:
-                         conn.execute("ALTER TABLE products ADD COLUMN prices_json TEXT DEFAULT '{}'")
-                     except:
-                         pass
+    def _build_shop_catalog(self, conn, shop_name):
+        # Runs inside the caller's transaction
+        conn.execute("DELETE FROM shop_catalog")
+        conn.execute("INSERT OR REPLACE INTO config (key, value) VALUES ('catalog_shop', ?)", (shop_name,))
+        conn.execute("""
+            INSERT INTO shop_catalog (product_id, price)
+            SELECT p.product_id, COALESCE(pp.price, pu.price)
+            FROM products p
+            LEFT JOIN product_prices pp ON pp.product_id = p.product_id AND pp.shop = ?
+            LEFT JOIN product_prices pu ON pu.product_id = p.product_id AND pu.shop = ?
+            WHERE COALESCE(pp.price, pu.price) IS NOT NULL
+        """, (shop_name, shop_name.replace(" ", "_")))
 
-                conn.execute("""
-                    CREATE TABLE IF NOT EXISTS products (
-                        product_id TEXT PRIMARY KEY,
-                        barcode TEXT,
-                        brand TEXT,
-                        category TEXT,
-                        flavor TEXT,
-                        price REAL,
-                        prices_json TEXT DEFAULT '{}',
-                        metadata_json TEXT,
-                        sync_status TEXT DEFAULT 'synced'
-                    );
-                """)
-                # Index for barcode search
-                conn.execute("CREATE INDEX IF NOT EXISTS idx_barcode ON products(barcode)")
-                
-                # Check for sales sync_status (Migration 3.3)
-                cursor = conn.execute("PRAGMA table_info(sales)")
-                s_columns = [info[1] for info in cursor.fetchall()]
-                if 'sync_status' not in s_columns:
-                    try:
-                        conn.execute("ALTER TABLE sales ADD COLUMN sync_status TEXT DEFAULT 'synced'") # Old sales assumed synced
-                    except:
-                        pass
-                
+    def _index_refresh(self, conn, product_ids):
+        """Write-through: re-reads the given products into the catalog index."""
+        index = self.catalog_index
+        if index is None:
+            return
+        sql, params = self._product_select(index.shop_name)
+        with index.lock:
+            for pid in product_ids:
+                row = conn.execute(sql + " WHERE p.product_id = ?", params + [pid]).fetchone()
+                if row:
+                    index.put(self._row_to_dict(row))
+                else:
+                    index.remove(pid)
+
+    def init_db(self):
+        """
+        Brings the schema up to date.
+        The schema version lives in PRAGMA user_version, so an up-to-date
+        database opens with a single pragma read.
+        """
+        try:
+            conn = self.get_connection()
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < len(MIGRATIONS):
+                run_migrations(conn)
         except sqlite3.Error as e:
             print(f"Error initializing local database: {e}")
 
-    def replace_all_products(self, products_list):
+    def replace_all_products(self, products, chunk_size=1000):
         """
-        Replaces the entire local cache with the provided list.
-        Expects list of dicts: {product_id, barcode, brand, category, flavor, prices: {Shop: Price}}
+        Replaces the entire local cache with the given products.
+        Accepts any iterable (a generator streaming the cloud download is fine) of dicts:
+        {product_id, barcode, brand, category, flavor, prices: {Shop: Price}}
+
+        Rows are written chunk by chunk into TEMP staging tables, so memory stays flat.
+        The live tables are only swapped in a single transaction once the iterable is
+        exhausted: if the download fails midway, the old cache is left untouched.
         """
+        conn = self.get_connection()
         try:
-            with self.get_connection() as conn:
-                conn.execute("DELETE FROM products")
-                
-                unique_shops = set()
+            conn.execute("DROP TABLE IF EXISTS temp.products_staging")
+            conn.execute("DROP TABLE IF EXISTS temp.product_prices_staging")
+            conn.execute("""
+                CREATE TEMP TABLE products_staging (
+                    product_id TEXT PRIMARY KEY, barcode TEXT, brand TEXT, category TEXT, flavor TEXT,
+                    price REAL, metadata_json TEXT, sync_status TEXT, gtin TEXT
+                )
+            """)
+            conn.execute("CREATE TEMP TABLE product_prices_staging (product_id TEXT, shop TEXT, price REAL, PRIMARY KEY (product_id, shop))")
+
+            unique_shops = set()
+            with conn:
                 data_tuples = []
-                for p in products_list:
+                price_tuples = []
+                for p in products:
                     # Clean/Normalize data
                     p_id = p.get('product_id')
                     barcode = p.get('barcode')
@@ -124,7 +728,7 @@ class Database:
                     # Store all prices
                     prices = p.get('prices', {})
                     unique_shops.update(prices.keys())
-                    prices_json = json.dumps(prices)
+                    price_tuples.extend((p_id, shop, price) for shop, price in prices.items())
                     
                     # Set 'price' to 0 or arbitrary value, as it depends on shop
                     price = 0.0
@@ -133,48 +737,100 @@ class Database:
                     # Sync status is 'synced' because we just downloaded it
                     sync_status = 'synced'
                     
-                    data_tuples.append((p_id, barcode, brand, category, flavor, price, prices_json, metadata, sync_status))
-                
-                conn.executemany("""
-                    INSERT INTO products (product_id, barcode, brand, category, flavor, price, prices_json, metadata_json, sync_status)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, data_tuples)
+                    data_tuples.append((p_id, barcode, brand, category, flavor, price, metadata, sync_status, canonical_gtin(barcode)))
+                    if len(data_tuples) >= chunk_size:
+                        self._stage_products(conn, data_tuples, price_tuples)
+                        data_tuples = []
+                        price_tuples = []
+                self._stage_products(conn, data_tuples, price_tuples)
+
+            # Atomic swap
+            catalog_shop = self.get_config('catalog_shop')
+            with conn:
+                conn.execute("DELETE FROM products")
+                conn.execute("DELETE FROM product_prices")
+                conn.execute("""
+                    INSERT INTO products (product_id, barcode, brand, category, flavor, price, metadata_json, sync_status, gtin)
+                    SELECT product_id, barcode, brand, category, flavor, price, metadata_json, sync_status, gtin FROM temp.products_staging
+                """)
+                conn.execute("INSERT INTO product_prices (product_id, shop, price) SELECT product_id, shop, price FROM temp.product_prices_staging")
+                if catalog_shop:
+                    self._build_shop_catalog(conn, catalog_shop)
+                generation = self._bump_catalog_generation(conn)
 
                 # Save cached shops
-                try:
-                    shops_list = sorted(list(unique_shops))
-                    conn.execute("INSERT OR REPLACE INTO config (key, value) VALUES ('cached_shops', ?)", (json.dumps(shops_list),))
-                except Exception as e:
-                    print(f"Error caching shops: {e}")
-                
+                shops_list = sorted(list(unique_shops))
+                conn.execute("INSERT OR REPLACE INTO config (key, value) VALUES ('cached_shops', ?)", (json.dumps(shops_list),))
+            self._catalog_generation_committed(generation)
+            self.config.written('cached_shops', json.dumps(shops_list))
+            self.product_cache.clear()
+
         except sqlite3.Error as e:
             print(f"Error replacing local cache: {e}")
+        finally:
+            try:
+                conn.execute("DROP TABLE IF EXISTS temp.products_staging")
+                conn.execute("DROP TABLE IF EXISTS temp.product_prices_staging")
+            except sqlite3.Error:
+                pass
+
+        if self.catalog_index is not None:
+            self.enable_catalog_index(self.catalog_index.shop_name)
+        if self.barcode_filter is not None:
+            self.build_barcode_filter()
+
+    def _stage_products(self, conn, data_tuples, price_tuples):
+        conn.executemany("""
+            INSERT OR REPLACE INTO temp.products_staging (product_id, barcode, brand, category, flavor, price, metadata_json, sync_status, gtin)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, data_tuples)
+        conn.executemany("INSERT OR REPLACE INTO temp.product_prices_staging (product_id, shop, price) VALUES (?, ?, ?)", price_tuples)
 
     # --- Read Methods (GUI Usage) ---
 
     def get_product_info(self, product_id, shop_name=None):
         """Local lookup."""
+        index = self.catalog_index
+        if index is not None and index.covers(shop_name):
+            return index.get(product_id)
+        # Cart redraws ask for every line again: keep the resolved dicts around
+        cache = self.product_cache
+        key = (product_id, shop_name)
+        found, product = cache.get(key)
+        if found:
+            return product
+        version = cache.version
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT product_id, barcode, brand, category, flavor, price, prices_json, metadata_json, sync_status FROM products WHERE product_id = ?", (product_id,))
-                row = cursor.fetchone()
-                if row:
-                    return self._row_to_dict(row, shop_name)
+                sql, params = self._product_select(shop_name)
+                row = conn.execute(sql + " WHERE p.product_id = ?", params + [product_id]).fetchone()
+                product = self._row_to_dict(row) if row else None
+                cache.put(key, product, version)
+                return product
         except sqlite3.Error as e:
             print(f"Error fetching product info: {e}")
         return None
 
     def get_products_by_barcode_and_shop(self, barcode, shop_name=None):
         """Local lookup by barcode."""
+        index = self.catalog_index
+        if index is not None and index.covers(shop_name):
+            return index.find_barcode(barcode)
+        # A dict lookup is cheaper than the filter; everything below isn't
+        if not self.might_have_barcode(barcode):
+            return []
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT product_id, barcode, brand, category, flavor, price, prices_json, metadata_json, sync_status FROM products WHERE barcode = ?", (barcode,))
-                rows = cursor.fetchall()
+                sql, params = self._product_select(shop_name)
+                gtin = canonical_gtin(barcode)
+                if gtin:
+                    # UPC-A, EAN-13 etc. of the same item all share one gtin
+                    rows = conn.execute(sql + " WHERE p.gtin = ?", params + [gtin]).fetchall()
+                else:
+                    rows = conn.execute(sql + " WHERE p.barcode = ?", params + [barcode]).fetchall()
                 results = []
                 for r in rows:
-                    prod = self._row_to_dict(r, shop_name)
+                    prod = self._row_to_dict(r)
                     # Filter if shop_name provided and price exists?
                     # Or just return whatever price we resolved to (could be 0)
                     # For V3 App flow, it expects result only if valid for shop?
@@ -187,165 +843,343 @@ class Database:
             print(f"Error fetching by barcode: {e}")
         return []
 
-    def search_products(self, term, shop_name=None):
-        """Local wildcard search."""
+    def search_products(self, term, shop_name=None, limit=50):
+        """
+        Local type-ahead search.
+        Every word of term is matched as an accent-insensitive prefix against
+        barcode, brand, category and flavor; returns the top `limit` results by relevance.
+        """
+        if not self.fts_enabled:
+            return self._search_products_like(term, shop_name, limit)
+
+        words = re.findall(r"\w+", term)
+        if not words:
+            return []
+        match = " ".join(f'"{w}"*' for w in words)
+        try:
+            with self.get_connection() as conn:
+                sql, params = self._product_select(shop_name)
+                rows = conn.execute(sql + """
+                    JOIN (
+                        SELECT rowid AS fts_rowid, rank FROM products_fts
+                        WHERE products_fts MATCH ? ORDER BY rank LIMIT ?
+                    ) AS hits ON p.rowid = hits.fts_rowid
+                    ORDER BY hits.rank
+                """, params + [match, limit]).fetchall()
+                return [self._row_to_dict(r) for r in rows]
+        except sqlite3.OperationalError as e:
+            if 'no such table' not in str(e):
+                print(f"Error searching: {e}")
+                return []
+            # products_fts was never created (SQLite built without FTS5)
+            self.fts_enabled = False
+            return self._search_products_like(term, shop_name, limit)
+        except sqlite3.Error as e:
+            print(f"Error searching: {e}")
+        return []
+
+    def _search_products_like(self, term, shop_name=None, limit=50):
+        """Wildcard search used when FTS5 is not available."""
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
                 t = f"%{term}%"
-                cursor.execute("""
-                    SELECT product_id, barcode, brand, category, flavor, price, prices_json, metadata_json, sync_status FROM products 
-                    WHERE barcode LIKE ? OR category LIKE ? OR flavor LIKE ? OR brand LIKE ?
-                """, (t, t, t, t))
-                rows = cursor.fetchall()
-                return [self._row_to_dict(r, shop_name) for r in rows]
+                sql, params = self._product_select(shop_name)
+                rows = conn.execute(sql + """
+                    WHERE p.barcode LIKE ? OR p.category LIKE ? OR p.flavor LIKE ? OR p.brand LIKE ?
+                    LIMIT ?
+                """, params + [t, t, t, t, limit]).fetchall()
+                return [self._row_to_dict(r) for r in rows]
         except sqlite3.Error as e:
             print(f"Error searching: {e}")
         return []
         
     def get_all_products_local(self):
-        """Returns all products from local cache for sync comparison."""
+        """
+        Returns all products from local cache for sync comparison.
+        Each dict carries 'prices': {Shop: Price} built from product_prices.
+        """
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT product_id, barcode, brand, category, flavor, price, prices_json, metadata_json, sync_status FROM products")
-                rows = cursor.fetchall()
-                return [self._row_to_dict(r) for r in rows]
+                prices = {}
+                for pid, shop, price in conn.execute("SELECT product_id, shop, price FROM product_prices"):
+                    prices.setdefault(pid, {})[shop] = price
+
+                sql, params = self._product_select()
+                products = []
+                for r in conn.execute(sql, params):
+                    d = self._row_to_dict(r)
+                    d['prices'] = prices.get(d['product_id'], {})
+                    products.append(d)
+                return products
         except sqlite3.Error as e:
             print(f"Error fetching all products: {e}")
             return []
 
-    def _row_to_dict(self, row, shop_name=None):
-        # Map tuple back to dict expected by GUI (Flat structure)
-        # Table: product_id, barcode, brand, category, flavor, price, prices_json, metadata_json, sync_status
-        # Index: 0           1        2      3         4       5      6            7              8
-        
-        # Check column count to handle runtime migration
-        has_prices = len(row) > 8 
-
-        def safe_json_loads(val):
-            try:
-                if not val: return {}
-                return json.loads(val)
-            except:
-                return {}
-        
-        metadata = {}
-        if has_prices:
-             metadata = safe_json_loads(row[7])
-        elif len(row) > 6:
-             metadata = safe_json_loads(row[6])
+    def _product_select(self, shop_name=None):
+        """
+        Returns (sql, params) selecting the columns _row_to_dict expects from products (alias p).
+        With a shop, the price is resolved by joining product_prices on the exact shop
+        name, then on its underscore variant (the cloud attribute style), else 0.0.
+        For the catalog shop that resolution is already materialized in shop_catalog.
+        Callers append their own WHERE / JOIN clauses.
+        """
+        if not shop_name:
+            return ("SELECT p.product_id, p.barcode, p.brand, p.category, p.flavor, p.price, p.sync_status FROM products p", [])
+        if shop_name == self.get_config('catalog_shop'):
+            # Pre-resolved by shop_catalog
+            return ("""
+                SELECT p.product_id, p.barcode, p.brand, p.category, p.flavor,
+                       COALESCE(sc.price, 0.0), p.sync_status
+                FROM products p
+                LEFT JOIN shop_catalog sc ON sc.product_id = p.product_id
+            """, [])
+        return ("""
+            SELECT p.product_id, p.barcode, p.brand, p.category, p.flavor,
+                   COALESCE(pp.price, pu.price, 0.0), p.sync_status
+            FROM products p
+            LEFT JOIN product_prices pp ON pp.product_id = p.product_id AND pp.shop = ?
+            LEFT JOIN product_prices pu ON pu.product_id = p.product_id AND pu.shop = ?
+        """, [shop_name, shop_name.replace(" ", "_")])
 
-        d = {
+    def _row_to_dict(self, row):
+        # Map tuple back to dict expected by GUI (Flat structure)
+        # Row: product_id, barcode, brand, category, flavor, preco (resolved), sync_status
+        return {
             'product_id': row[0],
             'barcode': row[1],
             'marca': row[2],
             'categoria': row[3],
             'sabor': row[4],
-            'metadata': metadata,
-            'prices_json': row[6] if has_prices else None
+            'preco': row[5] if row[5] is not None else 0.0,
+            'sync_status': row[6] or 'synced'
         }
-        
-        # Price Resolution
-        base_price = row[5] # Default column
-        prices_json = {}
-        if has_prices:
-            prices_json = safe_json_loads(row[6])
-        
-        # If shop_name provided, try to find specific price
-        final_price = base_price
-        if shop_name and prices_json:
-            # NORMALIZATION DEBUG
-            # Try exact match, then try replacing underscores/spaces
-            if shop_name in prices_json:
-                final_price = float(prices_json[shop_name])
-            else:
-                 # Try variations?
-                 print(f"DEBUG: Shop '{shop_name}' not in prices: {list(prices_json.keys())}")
-                 # Fallback: maybe the key has underscores?
-                 shop_u = shop_name.replace(" ", "_")
-                 if shop_u in prices_json:
-                     final_price = float(prices_json[shop_u])
-                 else:
-                     final_price = 0.0
-
-        d['preco'] = final_price
-        
-        if has_prices:
-            d['sync_status'] = row[8]
-        elif len(row) > 7:
-             d['sync_status'] = row[7]
-        else:
-            d['sync_status'] = 'synced'
-
-        return d
 
     # --- Sales Methods ---
 
-    def record_sale(self, final_price, payment_method, products_dict):
+    def record_sale(self, final_price, payment_method, products_dict, sale_id=None, timestamp=None):
+        """
+        Stores a finished sale and its line items in one transaction.
+        sale_id should be the app's Sale.id; one is generated if missing.
+        Returns the sale_id.
+        """
+        sale = {
+            'sale_id': sale_id,
+            'final_price': final_price,
+            'payment_method': payment_method,
+            'products_dict': products_dict,
+            'timestamp': timestamp,
+        }
+        return self.record_sales([sale])[0]
+
+    def enqueue_sale(self, final_price, payment_method, products_dict, sale_id=None):
+        """
+        Hands the sale to the database's writer thread and returns a SaleTicket
+        right away; ticket.wait() / add_done_callback() tell when it is committed.
+        """
+        return SaleWriter.for_database(self).submit(final_price, payment_method, products_dict, sale_id=sale_id)
+
+    def flush_sales(self, timeout=None):
+        """Waits until every queued sale is committed. True if all made it in time."""
+        writer = SaleWriter.running(self)
+        return writer.flush(timeout) if writer else True
+
+    def record_sales(self, sales):
+        """
+        Stores several sales (dicts with record_sale's arguments as keys) in a
+        single transaction, so a burst costs one commit. All or nothing.
+        Returns their sale_ids.
+        """
         try:
-            # Products dict is {product_id: details}
-            products_json = json.dumps(products_dict)
-            
-            # Use Local Time explicitly
-            local_ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
-            
+            sale_rows = []
+            items = []
+            for sale in sales:
+                sale_id = sale.get('sale_id')
+                if not sale_id:
+                    import uuid
+                    sale_id = str(uuid.uuid4())
+
+                # Products dict is {product_id: details}
+                products_dict = sale['products_dict']
+                products_json = json.dumps(products_dict)
+
+                # Use Local Time explicitly
+                local_ts = sale.get('timestamp') or datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+
+                sale_rows.append((sale_id, local_ts, sale['final_price'], sale['payment_method'], products_json))
+                items.extend(
+                    (sale_id, str(product_id), d.get('categoria', ''), d.get('sabor', ''), d.get('preco', 0.0), d.get('quantidade', 0))
+                    for product_id, d in products_dict.items()
+                )
             with self.get_connection() as conn:
-                conn.execute("""
-                    INSERT INTO sales (timestamp, final_price, payment_method, products_json, sync_status)
-                    VALUES (?, ?, ?, ?, 'pending')
-                """, (local_ts, final_price, payment_method, products_json))
+                conn.executemany("""
+                    INSERT INTO sales (sale_id, timestamp, final_price, payment_method, products_json, sync_status)
+                    VALUES (?, ?, ?, ?, ?, 'pending')
+                """, sale_rows)
+                conn.executemany("""
+                    INSERT INTO sale_items (sale_id, product_id, category, flavor, price, quantity)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, items)
+            return [row[0] for row in sale_rows]
         except sqlite3.Error as e:
             print(f"Error recording sale: {e}")
             raise e
 
-    def mark_sale_synced(self, timestamp):
+    def get_pending_sales(self):
+        """Sales not yet uploaded, oldest first (served by the partial idx_sales_unsynced index)."""
+        try:
+            with self.get_connection() as conn:
+                rows = conn.execute("""
+                    SELECT sale_id, timestamp, final_price, payment_method, products_json, sync_status
+                    FROM sales WHERE sync_status IS NOT 'synced' ORDER BY timestamp
+                """).fetchall()
+                return [{
+                    'sale_id': r[0],
+                    'timestamp': r[1],
+                    'final_price': r[2],
+                    'payment_method': r[3],
+                    'products_json': r[4],
+                    'sync_status': r[5]
+                } for r in rows]
+        except sqlite3.Error as e:
+            print(f"Error reading pending sales: {e}")
+            raise e
+
+    def mark_sale_synced(self, sale_id):
+        self.mark_sales_synced([sale_id])
+
+    def mark_sales_synced(self, sale_ids, chunk_size=500):
+        """Marks a batch of uploaded sales as synced in one transaction."""
+        sale_ids = list(sale_ids)
         try:
             with self.get_connection() as conn:
-                # Timestamp is unique enough for this single device log
-                conn.execute("UPDATE sales SET sync_status = 'synced' WHERE timestamp = ?", (timestamp,))
+                for i in range(0, len(sale_ids), chunk_size):
+                    chunk = sale_ids[i:i + chunk_size]
+                    marks = ",".join("?" * len(chunk))
+                    conn.execute(f"UPDATE sales SET sync_status = 'synced' WHERE sale_id IN ({marks})", chunk)
         except sqlite3.Error as e:
-            print(f"Error marking sale synced: {e}")
+            print(f"Error marking sales synced: {e}")
 
     def get_sales_history(self, shop_name=None, limit=50):
+        return self.get_sales_page(shop_name=shop_name, limit=limit)[0]
+
+    def get_sales_page(self, shop_name=None, limit=50, cursor=None, start=None, end=None, payment_method=None):
+        """
+        One page of sales, newest first. Returns (rows, next_cursor); pass
+        next_cursor back to get the following page, it is None on the last one.
+        The cursor is the (timestamp, sale_id) of the last row, so each page is
+        a range seek on idx_sales_report however deep the user scrolls.
+        start/end are 'YYYY-MM-DD' bounds ([start, end)), payment_method an exact match.
+        """
+        where = "1 = 1"
+        params = []
+        if cursor:
+            where += " AND (timestamp, sale_id) < (?, ?)"
+            params.extend(cursor)
+        if start:
+            where += " AND timestamp >= ?"
+            params.append(start)
+        if end:
+            where += " AND timestamp < ?"
+            params.append(end)
+        if payment_method:
+            where += " AND payment_method = ?"
+            params.append(payment_method)
+        sql = f"SELECT sale_id, timestamp, final_price, payment_method, products_json FROM sales WHERE {where} ORDER BY timestamp DESC, sale_id DESC LIMIT ?"
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT timestamp, final_price, payment_method, products_json FROM sales ORDER BY timestamp DESC LIMIT ?", (limit,))
-                rows = cursor.fetchall()
-                
-                history = []
-                for row in rows:
-                    ts = row[0]
-                    # Parse timestamp (SQLite string)
-                    try:
-                         dt = datetime.strptime(ts.split('.')[0], '%Y-%m-%d %H:%M:%S')
-                    except:
-                         dt = datetime.now()
-
-                    history.append({
-                        'Data': dt.strftime('%Y-%m-%d'),
-                        'Horario': dt.strftime('%H:%M:%S'),
-                        'Preco Final': row[1],
-                        'Metodo de pagamento': row[2],
-                        'Produtos': row[3],
-                        'Shop': 'Local', # Metadata
-                        'timestamp': ts
-                    })
-                return history
+                rows = conn.execute(sql, params + [limit]).fetchall()
+
+            # Older sales live in the monthly archives. They are only opened once
+            # the page reaches below the archive horizon.
+            horizon = self.archiver.horizon() if self.archiver else None
+            if horizon and (len(rows) < limit or rows[-1][1] < horizon):
+                # A compaction in progress (or cut short) can have a sale in both
+                # places; the main database wins. Any copy that would make this
+                # page is in rows already, since the main query saw it too.
+                seen = {r[0] for r in rows}
+                archived = self.archiver.read_page(where, params, limit, cursor=cursor, start=start, end=end)
+                rows.extend(r for r in archived if r[0] not in seen)
+                rows.sort(key=lambda r: (r[1], r[0]), reverse=True)
+                rows = rows[:limit]
+
+            history = []
+            for row in rows:
+                ts = row[1]
+                # Parse timestamp (SQLite string)
+                try:
+                     dt = datetime.strptime(ts.split('.')[0], '%Y-%m-%d %H:%M:%S')
+                except:
+                     dt = datetime.now()
+
+                history.append({
+                    'Data': dt.strftime('%Y-%m-%d'),
+                    'Horario': dt.strftime('%H:%M:%S'),
+                    'Preco Final': row[2],
+                    'Metodo de pagamento': row[3],
+                    'Produtos': row[4],
+                    'Shop': 'Local', # Metadata
+                    'timestamp': ts,
+                    'sale_id': row[0]
+                })
+            next_cursor = (rows[-1][1], rows[-1][0]) if len(rows) == limit else None
+            return history, next_cursor
         except sqlite3.Error as e:
             print(f"Error history: {e}")
-            return []
+            return [], None
+
+    def compact_sales(self, should_continue=None):
+        """Moves old synced sales to the monthly archive files (see SalesArchiver.compact)."""
+        if not self.archiver:
+            return {'archived': 0, 'months': []}
+        try:
+            return self.archiver.compact(should_continue=should_continue)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error compacting sales: {e}")
+            return {'archived': 0, 'months': []}
+
+    def get_product_sales(self, product_id, start=None, end=None):
+        """
+        Units sold and revenue for one product, optionally within [start, end)
+        ('YYYY-MM-DD...' timestamps). Uses idx_sale_items_product.
+        Archived sales come from sale_items_summary, at day resolution.
+        """
+        sql = """
+            SELECT COALESCE(SUM(i.quantity), 0), COALESCE(SUM(i.quantity * i.price), 0.0), COUNT(DISTINCT i.sale_id)
+            FROM sale_items i JOIN sales s ON s.sale_id = i.sale_id
+            WHERE i.product_id = ?
+        """
+        summary_sql = """
+            SELECT COALESCE(SUM(quantity), 0), COALESCE(SUM(total), 0.0), COALESCE(SUM(sales), 0)
+            FROM sale_items_summary WHERE product_id = ?
+        """
+        params = [product_id]
+        summary_params = [product_id]
+        if start:
+            sql += " AND s.timestamp >= ?"
+            summary_sql += " AND day >= substr(?, 1, 10)"
+            params.append(start)
+            summary_params.append(start)
+        if end:
+            sql += " AND s.timestamp < ?"
+            summary_sql += " AND day < ?"
+            params.append(end)
+            summary_params.append(end)
+        try:
+            with self.get_connection() as conn:
+                qty, revenue, sales = conn.execute(sql, params).fetchone()
+                a_qty, a_revenue, a_sales = conn.execute(summary_sql, summary_params).fetchone()
+                return {'quantidade': qty + a_qty, 'total': revenue + a_revenue, 'vendas': sales + a_sales}
+        except sqlite3.Error as e:
+            print(f"Error product sales: {e}")
+            return {'quantidade': 0, 'total': 0.0, 'vendas': 0}
 
     # --- Config ---
+    # Served from self.config (ConfigStore), which writes through to the table
     def set_config(self, key, value):
-        with self.get_connection() as conn:
-            conn.execute("INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)", (key, value))
+        self.config.set(key, value)
 
     def get_config(self, key):
-        with self.get_connection() as conn:
-            row = conn.execute("SELECT value FROM config WHERE key=?", (key,)).fetchone()
-            return row[0] if row else None
+        return self.config.get(key)
 
     def get_last_sync_timestamp(self):
         return self.get_config('last_sync_timestamp')
@@ -354,13 +1188,7 @@ class Database:
         self.set_config('last_sync_timestamp', ts)
 
     def get_shops(self):
-        try:
-            val = self.get_config('cached_shops')
-            if val:
-                return json.loads(val)
-        except:
-             pass
-        return []
+        return self.config.get_json('cached_shops', [])
             
     
     def add_product(self, product_info, shop_name=None, sync_status='modified'):
@@ -390,48 +1218,166 @@ class Database:
             except:
                 price = 0.0
 
-            # Merge Prices Logic (Fix for Store Manager / Delta Sync)
-            current_prices = {}
-            # Try to fetch existing prices first
-            try:
-                 with self.get_connection() as conn:
-                     row = conn.execute("SELECT prices_json FROM products WHERE product_id=? OR barcode=?", (p_id, barcode)).fetchone()
-                     if row and row[0]:
-                         val = row[0]
-                         if val: current_prices = json.loads(val)
-            except:
-                pass
-
-            if shop_name:
-                current_prices[shop_name] = price
-                
-            prices_json_str = json.dumps(current_prices)
-
             # Update dictionary for metadata consistency
             product_info['preco'] = price
             product_info['marca'] = brand
             product_info['categoria'] = category
             product_info['sabor'] = flavor
-            product_info['prices'] = current_prices # Keep metadata consistent too
             
             metadata = json.dumps(product_info)
             
             with self.get_connection() as conn:
                 conn.execute("""
-                    INSERT OR REPLACE INTO products (product_id, barcode, brand, category, flavor, price, prices_json, metadata_json, sync_status)
+                    INSERT OR REPLACE INTO products (product_id, barcode, brand, category, flavor, price, metadata_json, sync_status, gtin)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (p_id, barcode, brand, category, flavor, price, prices_json_str, metadata, sync_status))
+                """, (p_id, barcode, brand, category, flavor, price, metadata, sync_status, canonical_gtin(barcode)))
+                # Prices of other shops are kept: only this shop's row is written
+                if shop_name:
+                    conn.execute("INSERT OR REPLACE INTO product_prices (product_id, shop, price) VALUES (?, ?, ?)", (p_id, shop_name, price))
+                    self._shop_catalog_refresh(conn, [p_id])
+                generation = self._bump_catalog_generation(conn)
+                self._index_refresh(conn, [p_id])
+            self._catalog_generation_committed(generation)
+            self.product_cache.clear()
+            self._barcode_filter_add([barcode])
                 
             return p_id
         except sqlite3.Error as e:
             print(f"Error adding product locally: {e}")
             raise e 
     
+    def upsert_products(self, products, shop_name=None, sync_status='synced', chunk_size=500):
+        """
+        Bulk version of add_product for sync downloads.
+        Writes every product in a single transaction, chunk by chunk.
+        Each item uses the same keys as add_product; prices come from item['prices']
+        ({Shop: Price}) or from 'preco' for item['shop_name'] / the shop_name argument.
+        Prices of shops not mentioned are kept.
+        Returns {'inserted': n, 'updated': n, 'unchanged': n}.
+        """
+        stats = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        barcodes = []
+        try:
+            with self.get_connection() as conn:
+                chunk = []
+                for item in products:
+                    chunk.append(item)
+                    if len(chunk) >= chunk_size:
+                        self._upsert_chunk(conn, chunk, shop_name, sync_status, stats, barcodes)
+                        chunk = []
+                if chunk:
+                    self._upsert_chunk(conn, chunk, shop_name, sync_status, stats, barcodes)
+                generation = self._bump_catalog_generation(conn) if barcodes else None
+            if generation:
+                self._catalog_generation_committed(generation)
+                self.product_cache.clear()
+            self._barcode_filter_add(barcodes)
+        except sqlite3.Error as e:
+            print(f"Error upserting products locally: {e}")
+            raise e
+        return stats
+
+    def _upsert_chunk(self, conn, chunk, shop_name, sync_status, stats, barcodes):
+        # 1. Normalize and coalesce rows of the same product (one row per shop in delta downloads)
+        incoming = {}
+        for info in chunk:
+            p_id = info.get('product_id')
+            if not p_id:
+                import uuid
+                p_id = str(uuid.uuid4())
+                info['product_id'] = p_id
+            try:
+                price = float(info.get('preco') or info.get('price', 0.0) or 0.0)
+            except (TypeError, ValueError):
+                price = 0.0
+
+            prices = {}
+            if info.get('prices'):
+                prices.update({s: float(v or 0.0) for s, v in info['prices'].items()})
+            else:
+                shop = info.get('shop_name') or shop_name
+                if shop:
+                    prices[shop] = price
+
+            row = (
+                info.get('barcode'),
+                info.get('marca') or info.get('brand', ''),
+                info.get('categoria') or info.get('category', ''),
+                info.get('sabor') or info.get('flavor', ''),
+            )
+            if p_id in incoming:
+                incoming[p_id]['prices'].update(prices)
+                incoming[p_id]['row'] = row
+                incoming[p_id]['price'] = price
+            else:
+                incoming[p_id] = {'row': row, 'price': price, 'prices': prices, 'info': info}
+
+        # 2. Load current state for the chunk
+        ids = list(incoming)
+        marks = ",".join("?" * len(ids))
+        existing = {
+            r[0]: (r[1:5], r[5])
+            for r in conn.execute(f"SELECT product_id, barcode, brand, category, flavor, sync_status FROM products WHERE product_id IN ({marks})", ids)
+        }
+        existing_prices = {}
+        for pid, shop, price in conn.execute(f"SELECT product_id, shop, price FROM product_prices WHERE product_id IN ({marks})", ids):
+            existing_prices[(pid, shop)] = price
+
+        # 3. Diff
+        inserts, updates, price_rows, touched = [], [], [], []
+        for pid, new in incoming.items():
+            changed_prices = [
+                (pid, shop, price) for shop, price in new['prices'].items()
+                if existing_prices.get((pid, shop)) != price
+            ]
+            cur = existing.get(pid)
+            if cur is None:
+                inserts.append((pid, *new['row'], new['price'], json.dumps(new['info']), sync_status, canonical_gtin(new['row'][0])))
+                stats['inserted'] += 1
+            elif cur[0] != new['row'] or cur[1] != sync_status or changed_prices:
+                updates.append((*new['row'], new['price'], json.dumps(new['info']), sync_status, canonical_gtin(new['row'][0]), pid))
+                stats['updated'] += 1
+            else:
+                stats['unchanged'] += 1
+                continue
+            price_rows.extend(changed_prices)
+            touched.append(pid)
+            barcodes.append(new['row'][0])
+
+        # 4. Write
+        if inserts:
+            conn.executemany("""
+                INSERT INTO products (product_id, barcode, brand, category, flavor, price, metadata_json, sync_status, gtin)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, inserts)
+        if updates:
+            conn.executemany("""
+                UPDATE products SET barcode = ?, brand = ?, category = ?, flavor = ?, price = ?, metadata_json = ?, sync_status = ?, gtin = ?
+                WHERE product_id = ?
+            """, updates)
+        if price_rows:
+            conn.executemany("INSERT OR REPLACE INTO product_prices (product_id, shop, price) VALUES (?, ?, ?)", price_rows)
+            self._shop_catalog_refresh(conn, list({row[0] for row in price_rows}))
+        self._index_refresh(conn, touched)
+
     def mark_product_synced(self, barcode):
         """Updates the status of a product to 'synced'."""
+        self.mark_products_synced([barcode])
+
+    def mark_products_synced(self, barcodes):
+        """Marks a batch of uploaded products as synced in one transaction."""
+        barcodes = list(barcodes)
+        if not barcodes:
+            return
         try:
             with self.get_connection() as conn:
-                conn.execute("UPDATE products SET sync_status = 'synced' WHERE barcode = ?", (barcode,))
+                conn.executemany("UPDATE products SET sync_status = 'synced' WHERE barcode = ?", [(b,) for b in barcodes])
+                generation = self._bump_catalog_generation(conn)
+            self._catalog_generation_committed(generation)
+            self.product_cache.clear()
+            if self.catalog_index is not None:
+                for barcode in barcodes:
+                    self.catalog_index.set_sync_status(barcode, 'synced')
         except sqlite3.Error as e:
             print(f"Error marking product synced: {e}")
             
@@ -439,6 +1385,13 @@ class Database:
         """Hard delete of a product (usually after sync deletion confirmation)."""
         try:
             with self.get_connection() as conn:
+                conn.execute("DELETE FROM shop_catalog WHERE product_id IN (SELECT product_id FROM products WHERE barcode = ?)", (barcode,))
+                conn.execute("DELETE FROM product_prices WHERE product_id IN (SELECT product_id FROM products WHERE barcode = ?)", (barcode,))
                 conn.execute("DELETE FROM products WHERE barcode = ?", (barcode,))
+                generation = self._bump_catalog_generation(conn)
+            self._catalog_generation_committed(generation)
+            self.product_cache.clear()
+            if self.catalog_index is not None:
+                self.catalog_index.remove_barcode(barcode)
         except sqlite3.Error as e:
             print(f"Error deleting product: {e}")
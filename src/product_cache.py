@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+
+
+class ProductCache:
+    """
+    Bounded LRU of resolved product dicts keyed by (product_id, shop_name),
+    for lookups the catalog index doesn't cover. Misses (None) are cached too:
+    manual items in the cart are looked up on every redraw and never exist.
+
+    Database clears it on every catalog write, once inside the transaction and
+    again after commit. put() takes the version read before the lookup and
+    drops the value if a clear happened in between, so a read that raced a
+    write can't cache the old row.
+    """
+
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns (found, product). product is a copy, or None for a cached miss."""
+        with self.lock:
+            try:
+                product = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return True, dict(product) if product is not None else None
+
+    def put(self, key, product, version):
+        with self.lock:
+            if version != self.version:
+                return
+            self._entries[key] = dict(product) if product is not None else None
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+            self.version += 1
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
@@ -0,0 +1,100 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+
+class SalesReport:
+    """
+    Sales aggregates computed in SQL over the local sales / sale_items tables
+    and the summaries of archived sales.
+    Periods are half-open [start, end) date strings ('YYYY-MM-DD'), which map to
+    range scans on the timestamp index instead of decoding products_json.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    @staticmethod
+    def day_range(day=None):
+        """Returns (start, end) covering one calendar day (today by default)."""
+        if day is None:
+            day = datetime.now().strftime('%Y-%m-%d')
+        end = (datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        return day, end
+
+    def _query(self, sql, params):
+        try:
+            with self.db.get_connection() as conn:
+                return conn.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error building report: {e}")
+            return []
+
+    # Live sales UNION ALL the per-day aggregates of sales already moved to the
+    # monthly archives (src.sales_archive), as (day, hour, method, sales, total)
+    SALES_ROWS = """
+        WITH rows (day, hour, method, sales, total) AS (
+            SELECT substr(timestamp, 1, 10), CAST(substr(timestamp, 12, 2) AS INTEGER), payment_method, 1, final_price
+            FROM sales WHERE timestamp >= ?1 AND timestamp < ?2
+            UNION ALL
+            SELECT day, hour, payment_method, sales, total
+            FROM sales_summary WHERE day >= ?1 AND day < ?2
+        )
+    """
+
+    def totals(self, start, end):
+        rows = self._query(self.SALES_ROWS + """
+            SELECT COALESCE(SUM(sales), 0), COALESCE(SUM(total), 0.0) FROM rows
+        """, (start, end))
+        count, total = rows[0] if rows else (0, 0.0)
+        return {'vendas': count, 'total': total, 'ticket_medio': total / count if count else 0.0}
+
+    def totals_by_day(self, start, end):
+        rows = self._query(self.SALES_ROWS + """
+            SELECT day, SUM(sales), SUM(total) FROM rows
+            GROUP BY day ORDER BY day
+        """, (start, end))
+        return [{'Data': r[0], 'vendas': r[1], 'total': r[2]} for r in rows]
+
+    def totals_by_hour(self, start, end):
+        rows = self._query(self.SALES_ROWS + """
+            SELECT hour, SUM(sales), SUM(total) FROM rows
+            GROUP BY hour ORDER BY hour
+        """, (start, end))
+        return [{'hora': r[0], 'vendas': r[1], 'total': r[2]} for r in rows]
+
+    def totals_by_payment_method(self, start, end):
+        rows = self._query(self.SALES_ROWS + """
+            SELECT COALESCE(NULLIF(method, ''), 'Não informado') AS m, SUM(sales), SUM(total) FROM rows
+            GROUP BY m ORDER BY SUM(total) DESC
+        """, (start, end))
+        return [{'Metodo de pagamento': r[0], 'vendas': r[1], 'total': r[2]} for r in rows]
+
+    def top_products(self, start, end, limit=10):
+        """Best sellers by units. Manual entries ('Manual_N') are not real products and are skipped."""
+        rows = self._query("""
+            WITH items (product_id, category, flavor, quantity, total) AS (
+                SELECT i.product_id, i.category, i.flavor, i.quantity, i.quantity * i.price
+                FROM sales s JOIN sale_items i ON i.sale_id = s.sale_id
+                WHERE s.timestamp >= ?1 AND s.timestamp < ?2
+                UNION ALL
+                SELECT product_id, category, flavor, quantity, total
+                FROM sale_items_summary WHERE day >= ?1 AND day < ?2
+            )
+            SELECT product_id, MAX(category), MAX(flavor), SUM(quantity), SUM(total)
+            FROM items WHERE product_id NOT LIKE 'Manual%'
+            GROUP BY product_id
+            ORDER BY SUM(quantity) DESC
+            LIMIT ?3
+        """, (start, end, limit))
+        return [{'product_id': r[0], 'categoria': r[1], 'sabor': r[2], 'quantidade': r[3], 'total': r[4]} for r in rows]
+
+    def daily_close(self, day=None):
+        """Everything the end-of-day (Z-report) screen shows, for one day."""
+        start, end = self.day_range(day)
+        return {
+            'Data': start,
+            'resumo': self.totals(start, end),
+            'por_pagamento': self.totals_by_payment_method(start, end),
+            'por_hora': self.totals_by_hour(start, end),
+            'mais_vendidos': self.top_products(start, end),
+        }
@@ -0,0 +1,160 @@
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+_FLUSH = object()
+_STOP = object()
+
+
+class SaleTicket:
+    """
+    Handle for one queued write. wait() blocks until the writer has committed it
+    (True) or given up (False, see .error). Callbacks run on the writer thread.
+    """
+
+    def __init__(self, sale_id=None):
+        self.sale_id = sale_id
+        self.error = None
+        self._done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self._done.is_set() and self.error is None
+
+    def add_done_callback(self, callback):
+        """callback(ticket), immediately if already finished."""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self, error=None):
+        with self._lock:
+            self.error = error
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"Error in sale ticket callback: {e}")
+
+
+class SaleWriter:
+    """
+    Single writer thread for sale recording.
+    Sales are queued (bounded: submit blocks when the terminal is far behind)
+    and the writer drains whatever has piled up into one transaction, so a
+    burst of sales costs one commit and one fight for the write lock instead
+    of one thread per sale.
+    """
+
+    _writers = {}
+    _writers_lock = threading.Lock()
+
+    @classmethod
+    def for_database(cls, db):
+        """Returns the writer for db's file, starting it on first use (one per database file)."""
+        with cls._writers_lock:
+            writer = cls._writers.get(db.pool)
+            if writer is None or not writer.thread.is_alive():
+                writer = cls(db)
+                cls._writers[db.pool] = writer
+            return writer
+
+    @classmethod
+    def running(cls, db):
+        with cls._writers_lock:
+            writer = cls._writers.get(db.pool)
+            return writer if writer is not None and writer.thread.is_alive() else None
+
+    def __init__(self, db, max_queue=256, max_batch=64):
+        self.db = db
+        self.max_batch = max_batch
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = threading.Thread(target=self._run, name="SaleWriter", daemon=True)
+        self.thread.start()
+
+    def submit(self, final_price, payment_method, products_dict, sale_id=None):
+        """Queues a sale and returns its SaleTicket. The timestamp is taken now, not at write time."""
+        sale = {
+            'sale_id': sale_id,
+            'final_price': final_price,
+            'payment_method': payment_method,
+            # Snapshot: the UI may reuse the Sale after handing it over
+            'products_dict': {pid: dict(d) for pid, d in products_dict.items()},
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'),
+        }
+        ticket = SaleTicket(sale_id)
+        self.queue.put((sale, ticket))
+        return ticket
+
+    def flush(self, timeout=None):
+        """Blocks until everything submitted before this call is committed (or failed)."""
+        ticket = SaleTicket()
+        self.queue.put((_FLUSH, ticket))
+        return ticket.wait(timeout)
+
+    def close(self, timeout=None):
+        """Flushes and stops the writer thread."""
+        if not self.thread.is_alive():
+            return
+        ticket = SaleTicket()
+        self.queue.put((_STOP, ticket))
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            sales = [(sale, ticket) for sale, ticket in batch if sale is not _FLUSH and sale is not _STOP]
+            if sales:
+                self._write(sales)
+            # Markers sit after the sales they were queued behind, which are now written
+            markers = [(sale, ticket) for sale, ticket in batch if sale is _FLUSH or sale is _STOP]
+            for _, ticket in markers:
+                ticket._finish()
+            if any(sale is _STOP for sale, _ in markers):
+                return
+
+    def _write(self, sales):
+        try:
+            ids = self._with_retry(lambda: self.db.record_sales([sale for sale, _ in sales]))
+            for (_, ticket), sale_id in zip(sales, ids):
+                ticket.sale_id = sale_id
+                ticket._finish()
+        except Exception as e:
+            if len(sales) == 1:
+                print(f"Error saving sale: {e}")
+                sales[0][1]._finish(e)
+                return
+            # One bad sale must not take the others down with it
+            for sale in sales:
+                self._write([sale])
+
+    def _with_retry(self, write):
+        # busy_timeout already waits for the lock; if a long sync still holds it
+        # past that we keep trying, a sale is never dropped for being locked out
+        attempt = 0
+        while True:
+            try:
+                return write()
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    raise
+                attempt += 1
+                print(f"Sale writer: database locked, retry {attempt}")
+                time.sleep(min(0.2 * attempt, 2.0))
@@ -0,0 +1,251 @@
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+ARCHIVE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS sales (
+        sale_id TEXT PRIMARY KEY,
+        timestamp TEXT NOT NULL,
+        final_price REAL,
+        payment_method TEXT,
+        products_json TEXT,
+        sync_status TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sale_items (
+        sale_id TEXT NOT NULL,
+        product_id TEXT NOT NULL,
+        category TEXT,
+        flavor TEXT,
+        price REAL,
+        quantity INTEGER,
+        PRIMARY KEY (sale_id, product_id)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_sales_report ON sales(timestamp, sale_id, payment_method, final_price)",
+]
+
+
+def _next_month(month):
+    year, mon = map(int, month.split('-'))
+    return f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+
+
+class SalesArchiver:
+    """
+    Moves synced sales older than a horizon out of the main database into one
+    SQLite file per month (<db dir>/sales_archive/sales_YYYY-MM.db, same
+    sales/sale_items schema), keeping per-day aggregates in sales_summary /
+    sale_items_summary so reports still cover them.
+
+    Each month file is assembled in memory and written with the online
+    backup API to a temp file that then replaces the old one: the main
+    database is only read while archiving, and deletes happen in short
+    batches, so checkout never waits behind the job for long.
+    Config 'sales_archive_days' sets the horizon (default 90 days).
+    """
+
+    DEFAULT_HORIZON_DAYS = 90
+
+    def __init__(self, db, archive_dir=None, batch_size=500):
+        self.db = db
+        self.archive_dir = archive_dir or os.path.join(os.path.dirname(os.path.abspath(db.db_path)), 'sales_archive')
+        self.batch_size = batch_size
+
+    # --- Archive files ---
+
+    def month_path(self, month):
+        return os.path.join(self.archive_dir, f"sales_{month}.db")
+
+    def months(self):
+        """Archived months ('YYYY-MM'), oldest first."""
+        if not os.path.isdir(self.archive_dir):
+            return []
+        return sorted(
+            name[len('sales_'):-len('.db')]
+            for name in os.listdir(self.archive_dir)
+            if name.startswith('sales_') and name.endswith('.db')
+        )
+
+    def attach(self, conn, month):
+        """ATTACHes a month's archive to conn and returns its schema name (e.g. archive_2024_05)."""
+        schema = f"archive_{month.replace('-', '_')}"
+        conn.execute("ATTACH DATABASE ? AS " + schema, (self.month_path(month),))
+        return schema
+
+    def detach(self, conn, schema):
+        conn.execute("DETACH DATABASE " + schema)
+
+    def archived_until(self):
+        """Every sale older than this timestamp has been moved out (None if nothing was archived)."""
+        return self.db.get_config('sales_archived_until')
+
+    def horizon(self):
+        """
+        Every row in an archive file is older than this (None without archives).
+        Past archived_until when a month was only partly moved: its file already
+        holds the sales that did get deleted.
+        """
+        months = self.months()
+        if not months:
+            return None
+        return max(self.archived_until() or '', _next_month(months[-1]) + '-01')
+
+    # --- Compaction ---
+
+    def compact(self, horizon_days=None, should_continue=None):
+        """
+        Archives synced sales older than horizon_days, one month at a time.
+        should_continue() is checked between months and batches (return False to
+        stop early, e.g. when the terminal stops being idle); a stopped run
+        resumes where it left off. Returns {'archived': n, 'months': [...]}.
+        """
+        if horizon_days is None:
+            try:
+                horizon_days = int(self.db.get_config('sales_archive_days') or self.DEFAULT_HORIZON_DAYS)
+            except ValueError:
+                horizon_days = self.DEFAULT_HORIZON_DAYS
+        cutoff = (datetime.now() - timedelta(days=horizon_days)).strftime('%Y-%m-%d')
+        result = {'archived': 0, 'months': []}
+
+        conn = self.db.get_connection()
+        months = [r[0] for r in conn.execute(
+            "SELECT DISTINCT substr(timestamp, 1, 7) FROM sales WHERE timestamp < ? AND sync_status = 'synced' ORDER BY 1",
+            (cutoff,)
+        )]
+        for month in months:
+            if should_continue and not should_continue():
+                break
+            upper = min(_next_month(month) + '-01', cutoff)
+            moved, complete = self._archive_month(conn, month, upper, should_continue)
+            result['archived'] += moved
+            result['months'].append(month)
+            # Only once nothing of the month is left behind in the main database
+            if complete and (self.archived_until() or '') < upper:
+                self.db.set_config('sales_archived_until', upper)
+        return result
+
+    def _archive_month(self, conn, month, upper, should_continue):
+        """Returns (sales moved, whether the whole month was moved)."""
+        where = "s.timestamp >= ? AND s.timestamp < ? AND s.sync_status = 'synced'"
+        params = (month + '-01', upper)
+        sales = conn.execute(f"""
+            SELECT s.sale_id, s.timestamp, s.final_price, s.payment_method, s.products_json, s.sync_status
+            FROM sales s WHERE {where}
+        """, params).fetchall()
+        if not sales:
+            return 0, True
+        items = conn.execute(f"""
+            SELECT i.sale_id, i.product_id, i.category, i.flavor, i.price, i.quantity
+            FROM sale_items i JOIN sales s ON s.sale_id = i.sale_id WHERE {where}
+        """, params).fetchall()
+
+        # 1. Archive file first: if we stop before the deletes, the next run just rewrites the same rows
+        self._publish(month, sales, items)
+
+        # 2. Fold into the summaries and delete, in short transactions
+        moved = 0
+        ids = [row[0] for row in sales]
+        for i in range(0, len(ids), self.batch_size):
+            if should_continue and not should_continue():
+                break
+            batch = ids[i:i + self.batch_size]
+            marks = ",".join("?" * len(batch))
+            with conn:
+                conn.execute(f"""
+                    INSERT INTO sales_summary (day, hour, payment_method, sales, total)
+                    SELECT substr(timestamp, 1, 10), CAST(substr(timestamp, 12, 2) AS INTEGER), COALESCE(payment_method, ''),
+                           COUNT(*), COALESCE(SUM(final_price), 0.0)
+                    FROM sales WHERE sale_id IN ({marks}) AND sync_status = 'synced'
+                    GROUP BY 1, 2, 3
+                    ON CONFLICT (day, hour, payment_method) DO UPDATE SET
+                        sales = sales + excluded.sales, total = total + excluded.total
+                """, batch)
+                conn.execute(f"""
+                    INSERT INTO sale_items_summary (day, product_id, category, flavor, sales, quantity, total)
+                    SELECT substr(s.timestamp, 1, 10), i.product_id, MAX(i.category), MAX(i.flavor),
+                           COUNT(*), COALESCE(SUM(i.quantity), 0), COALESCE(SUM(i.quantity * i.price), 0.0)
+                    FROM sale_items i JOIN sales s ON s.sale_id = i.sale_id
+                    WHERE s.sale_id IN ({marks}) AND s.sync_status = 'synced'
+                    GROUP BY 1, 2
+                    ON CONFLICT (day, product_id) DO UPDATE SET
+                        sales = sales + excluded.sales, quantity = quantity + excluded.quantity, total = total + excluded.total
+                """, batch)
+                conn.execute(f"DELETE FROM sale_items WHERE sale_id IN (SELECT sale_id FROM sales WHERE sale_id IN ({marks}) AND sync_status = 'synced')", batch)
+                moved += conn.execute(f"DELETE FROM sales WHERE sale_id IN ({marks}) AND sync_status = 'synced'", batch).rowcount
+            # Let the sale writer in between batches
+            time.sleep(0.01)
+
+        # 3. Stopped early: take the rows that weren't deleted back out of the file
+        if moved < len(ids):
+            marks = ",".join("?" * len(ids))
+            left = [r[0] for r in conn.execute(f"SELECT sale_id FROM sales WHERE sale_id IN ({marks})", ids)]
+            if left:
+                self._publish(month, [], [], drop=left)
+                return moved, False
+        return moved, True
+
+    def _publish(self, month, sales, items, drop=()):
+        """Merges rows into the month's archive (minus the sale_ids in drop) and swaps the file in atomically."""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = self.month_path(month)
+        tmp_path = path + '.tmp'
+
+        mem = sqlite3.connect(':memory:')
+        try:
+            if os.path.exists(path):
+                src = sqlite3.connect(path)
+                try:
+                    src.backup(mem)
+                finally:
+                    src.close()
+            for stmt in ARCHIVE_SCHEMA:
+                mem.execute(stmt)
+            mem.executemany("INSERT OR IGNORE INTO sales VALUES (?, ?, ?, ?, ?, ?)", sales)
+            mem.executemany("INSERT OR IGNORE INTO sale_items VALUES (?, ?, ?, ?, ?, ?)", items)
+            mem.executemany("DELETE FROM sale_items WHERE sale_id = ?", [(sale_id,) for sale_id in drop])
+            mem.executemany("DELETE FROM sales WHERE sale_id = ?", [(sale_id,) for sale_id in drop])
+            mem.commit()
+
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            dst = sqlite3.connect(tmp_path)
+            try:
+                mem.backup(dst, pages=256, sleep=0.001)
+            finally:
+                dst.close()
+            os.replace(tmp_path, path)
+        finally:
+            mem.close()
+
+    # --- Reading ---
+
+    def read_page(self, where, params, limit, cursor=None, start=None, end=None):
+        """
+        Runs the sales page query (where/params as built by Database.get_sales_page)
+        over the archive files, newest month first, until limit rows are found.
+        Months entirely outside cursor/start/end are skipped without opening them.
+        """
+        rows = []
+        for month in reversed(self.months()):
+            month_start, month_end = month + '-01', _next_month(month) + '-01'
+            if cursor and month_start > cursor[0]:
+                continue
+            if (end and month_start >= end) or (start and month_end <= start):
+                continue
+            conn = sqlite3.connect(self.month_path(month))
+            try:
+                rows.extend(conn.execute(f"""
+                    SELECT sale_id, timestamp, final_price, payment_method, products_json FROM sales
+                    WHERE {where} ORDER BY timestamp DESC, sale_id DESC LIMIT ?
+                """, list(params) + [limit - len(rows)]).fetchall())
+            except sqlite3.Error as e:
+                print(f"Error reading sales archive {month}: {e}")
+            finally:
+                conn.close()
+            if len(rows) >= limit:
+                break
+        return rows
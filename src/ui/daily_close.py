@@ -0,0 +1,90 @@
+import flet as ft
+from datetime import datetime, timedelta
+
+from src.reports import SalesReport
+
+
+class DailyCloseDialog:
+    """End-of-day close (Z-report) for one day, built from src.reports aggregates."""
+
+    def __init__(self, page, app, day=None):
+        self.page = page
+        self.app = app
+        self.report = SalesReport(app.product_db)
+        self.day = day or datetime.now().strftime('%Y-%m-%d')
+
+        self.day_label = ft.Text("", size=18, weight=ft.FontWeight.BOLD)
+        self.body = ft.Column(expand=True, scroll=ft.ScrollMode.ALWAYS, spacing=6)
+        self.dialog = ft.AlertDialog(
+            title=ft.Row(
+                controls=[
+                    ft.Text("Fechamento do Dia"),
+                    ft.Container(expand=True),
+                    ft.IconButton(icon=ft.Icons.CHEVRON_LEFT, tooltip="Dia anterior", on_click=lambda e: self.shift_day(-1)),
+                    self.day_label,
+                    ft.IconButton(icon=ft.Icons.CHEVRON_RIGHT, tooltip="Próximo dia", on_click=lambda e: self.shift_day(1)),
+                ],
+                vertical_alignment=ft.CrossAxisAlignment.CENTER,
+            ),
+            content=ft.Container(content=self.body, width=600),
+        )
+        self.load_data()
+
+    @staticmethod
+    def money(value):
+        return f"R${(value or 0):.2f}"
+
+    def section(self, title, rows):
+        controls = [ft.Text(title, weight=ft.FontWeight.BOLD, size=16)]
+        if not rows:
+            controls.append(ft.Text("Nenhuma venda.", color=ft.Colors.GREY))
+        for cells in rows:
+            controls.append(ft.Row(
+                controls=[ft.Text(str(c), width=w) for c, w in zip(cells, (260, 100, 150))],
+            ))
+        controls.append(ft.Divider())
+        return controls
+
+    def load_data(self):
+        self.day_label.value = datetime.strptime(self.day, '%Y-%m-%d').strftime('%d/%m/%Y')
+        self.body.controls.clear()
+        try:
+            close = self.report.daily_close(self.day)
+            resumo = close['resumo']
+
+            self.body.controls.extend([
+                ft.Row(
+                    controls=[
+                        ft.Text(f"Total: {self.money(resumo['total'])}", size=22, weight=ft.FontWeight.BOLD),
+                        ft.Text(f"Vendas: {resumo['vendas']}", size=16),
+                        ft.Text(f"Ticket médio: {self.money(resumo['ticket_medio'])}", size=16),
+                    ],
+                    spacing=24,
+                ),
+                ft.Divider(),
+            ])
+            self.body.controls.extend(self.section(
+                "Por método de pagamento",
+                [(r['Metodo de pagamento'], r['vendas'], self.money(r['total'])) for r in close['por_pagamento']],
+            ))
+            self.body.controls.extend(self.section(
+                "Por hora",
+                [(f"{r['hora']:02d}:00", r['vendas'], self.money(r['total'])) for r in close['por_hora']],
+            ))
+            self.body.controls.extend(self.section(
+                "Mais vendidos",
+                [(f"{r['categoria'] or ''} {r['sabor'] or ''}".strip() or r['product_id'], r['quantidade'], self.money(r['total']))
+                 for r in close['mais_vendidos']],
+            ))
+        except Exception as e:
+            self.body.controls.append(ft.Text(f"Erro ao carregar fechamento: {e}", color=ft.Colors.RED))
+
+    def shift_day(self, delta):
+        day = datetime.strptime(self.day, '%Y-%m-%d') + timedelta(days=delta)
+        self.day = day.strftime('%Y-%m-%d')
+        self.load_data()
+        self.page.update()
+
+    def show(self):
+        self.page.open(self.dialog)
+        self.page.update()
@@ -4,6 +4,7 @@ import threading
 import time
 import unicodedata
 import src.ui.history as hist
+import src.ui.daily_close as daily_close
 
 # Local imports
 from src.aws_db import Database
@@ -16,6 +17,7 @@ import src.payment as payment
 import src.ui.sync_client as sync_client
 
 import src.db_sqlite as sqlite_db
+from src.backup import DatabaseBackup
 
 Version = "2.1.0"
 
@@ -65,10 +67,19 @@ class ProductApp:
         # Check for saved shop in LOCAL DB
         local_conn = sqlite_db.Database()
         saved_shop = local_conn.get_config('current_shop')
+
+        # Hourly online snapshots of the local DB (unsynced sales live only here)
+        self.backup = DatabaseBackup(local_conn)
+        self.backup.start()
         
         if saved_shop:
              self.product_db = local_conn  # Use local DB
              self.shop = saved_shop
+             # Warm the in-memory catalog so scans become dictionary lookups
+             # (filled from the mapped catalog snapshot when it is current)
+             threading.Thread(target=local_conn.enable_catalog_index, args=(saved_shop,), daemon=True).start()
+             # Until the index is warm, unknown barcodes are turned down without a query
+             threading.Thread(target=local_conn.open_barcode_filter, daemon=True).start()
              self.pay = payment.Payment(self, self.shop)
              
              self.ui = src.ui.main_window.MainWindow(self, page)
@@ -149,13 +160,10 @@ class ProductApp:
                     status_text.value = f"Baixado: {count} produtos..."
                     self.page.update()
 
-                products = aws_conn.get_all_products_grouped(progress_callback=on_progress)
-                
-                # 3. Save Local
-                status_text.value = "Salvando no cache local..."
-                self.page.update()
+                # 3. Save Local - streamed page by page into the cache.
+                # The previous cache is only replaced once the download completes.
                 local_conn = sqlite_db.Database()
-                local_conn.replace_all_products(products)
+                local_conn.replace_all_products(aws_conn.iter_all_products_grouped(progress_callback=on_progress))
                 
                 # FIX: Set timestamp so next sync is Delta, not Full
                 local_conn.set_last_sync_timestamp(datetime.now().isoformat())
@@ -998,19 +1006,12 @@ class ProductApp:
         self.page.update()
 
     def finalize_sale(self, internal_id):
-        def process_sale():
-            # Record sale to SQLite
-            print(f"DEBUG FINALIZED: ID={internal_id}, Price={final_price:.2f}, Time={datetime.now()}")
-            try:
-                self.product_db.record_sale(
-                    final_price=final_price, 
-                    payment_method=sale.payment_method, 
-                    products_dict=sale.current_sale
-                )
+        def on_saved(ticket):
+            # Runs on the sale writer thread once the sale is committed (or failed)
+            if ticket.error:
+                self.show_error(f"Erro ao salvar venda: {ticket.error}")
+            else:
                 self.mark_unsynced()
-            except Exception as e:
-                print(f"Error saving sale: {e}")
-                # You might want to show an error on UI here
 
         sale = next((sale for sale in self.stored_sales if sale.id == internal_id), None)
 
@@ -1025,11 +1026,15 @@ class ProductApp:
         # Apply promotion and calculate final price
         final_price = sale.calculate_total()
 
-        # Save sale details
-        # Save sale logic moved to record_sale
-        # Save sale details
-        # Save sale logic moved to record_sale
-        threading.Thread(target=process_sale).start()
+        # Queued to the single sale writer; on_saved fires when it is durable
+        print(f"DEBUG FINALIZED: ID={internal_id}, Price={final_price:.2f}, Time={datetime.now()}")
+        ticket = self.product_db.enqueue_sale(
+            final_price=final_price,
+            payment_method=sale.payment_method,
+            products_dict=sale.current_sale,
+            sale_id=sale.id
+        )
+        ticket.add_done_callback(on_saved)
 
         try:
             print(f"DEBUG: Starting UI cleanup for sale {internal_id}")
@@ -1047,6 +1052,10 @@ class ProductApp:
         hist.SalesHistoryDialog(self.page, self).show()
         self.page.update()
 
+    def show_daily_close(self, e=None):
+        daily_close.DailyCloseDialog(self.page, self).show()
+        self.page.update()
+
     def on_payment_method_change(self, e):
         method = self.payment_method_var.value
         # Logic: Enable Cobrar only for Pix, Debit, Credit
@@ -2,23 +2,62 @@ import flet as ft
 import math
 import ast
 import json
+import threading
+from datetime import datetime, timedelta
 
 
 class SalesHistoryDialog:
+    PAGE_SIZE = 50
+    PAYMENT_METHODS = ["Débito", "Pix", "Dinheiro", "Crédito"]
+
     def __init__(self, page, app):
         self.page = page
         self.app = app
         self.db = app.product_db
+        self.cursor = None
+        self.has_more = True
+        self.loading = False
+        self.generation = 0 # bumped on every filter change, stale pages are dropped
+        self.lock = threading.Lock()
+
+        self.start_entry = ft.TextField(label="De (dd/mm/aaaa)", width=150, dense=True, on_submit=lambda e: self.apply_filters())
+        self.end_entry = ft.TextField(label="Até (dd/mm/aaaa)", width=150, dense=True, on_submit=lambda e: self.apply_filters())
+        self.payment_filter = ft.Dropdown(
+            label="Pagamento",
+            width=150,
+            dense=True,
+            value="Todos",
+            options=[ft.dropdown.Option(x) for x in ["Todos"] + self.PAYMENT_METHODS],
+            on_change=lambda e: self.apply_filters(),
+        )
+        self.status = ft.Text("", color=ft.Colors.GREY)
+        self.rows_view = ft.ListView(
+            expand=True,
+            on_scroll=self.on_scroll,
+        )
         self.dialog = ft.AlertDialog(
             title=ft.Text("Histórico de Vendas"),
             content=ft.Container(
                 content=ft.Column(
+                    controls=[
+                        ft.Row(
+                            controls=[
+                                self.start_entry,
+                                self.end_entry,
+                                self.payment_filter,
+                                ft.IconButton(icon=ft.Icons.SEARCH, tooltip="Filtrar", on_click=lambda e: self.apply_filters()),
+                            ],
+                        ),
+                        self.header(),
+                        self.rows_view,
+                        self.status,
+                    ],
                     expand=True,
-                    scroll=ft.ScrollMode.ALWAYS,
                 ),
+                width=700,
             ),
         )
-        self.load_data()
+        self.load_more()
 
     def safe_parse_products(self, products_json):
         try:
@@ -54,71 +93,131 @@ class SalesHistoryDialog:
             formatted_lines.append(line)
         return formatted_lines
 
-    def load_data(self):
+    def header(self):
+        return ft.Row(
+            controls=[
+                ft.Text("Data", width=150, weight=ft.FontWeight.BOLD),
+                ft.Text("Horário", width=100, weight=ft.FontWeight.BOLD),
+                ft.Text("Preço Final", width=150, weight=ft.FontWeight.BOLD),
+                ft.Text("Método Pagamento", width=200, weight=ft.FontWeight.BOLD),
+            ],
+            vertical_alignment=ft.CrossAxisAlignment.START,
+        )
+
+    @staticmethod
+    def parse_date(value):
+        """'dd/mm/aaaa' -> 'YYYY-MM-DD' (None if empty). Raises ValueError if invalid."""
+        value = (value or "").strip()
+        if not value:
+            return None
+        return datetime.strptime(value, '%d/%m/%Y').strftime('%Y-%m-%d')
+
+    def filters(self):
+        start = self.parse_date(self.start_entry.value)
+        end = self.parse_date(self.end_entry.value)
+        if end:
+            # The typed end date is inclusive
+            end = (datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        method = self.payment_filter.value
+        return {
+            'start': start,
+            'end': end,
+            'payment_method': method if method in self.PAYMENT_METHODS else None,
+        }
+
+    def apply_filters(self):
         try:
-            # Load from AWS DB
-            sales_history = self.db.get_sales_history(shop_name=self.app.shop, limit=100)
-            
-            # Helper to safely display values
-            def safe_str(val):
-                return str(val) if val is not None and val != 'None' and val != 'nan' else ""
-
-            # Create header row
-            header = ft.Row(
-                controls=[
-                    ft.Text("Data", width=150, weight=ft.FontWeight.BOLD),
-                    ft.Text("Horário", width=100, weight=ft.FontWeight.BOLD),
-                    ft.Text("Preço Final", width=150, weight=ft.FontWeight.BOLD),
-                    ft.Text("Método Pagamento", width=200, weight=ft.FontWeight.BOLD),
-                ],
-                vertical_alignment=ft.CrossAxisAlignment.START,
+            self.filters()
+        except ValueError:
+            self.status.value = "Data inválida, use dd/mm/aaaa."
+            self.status.color = ft.Colors.RED
+            self.page.update()
+            return
+        with self.lock:
+            self.generation += 1
+            self.cursor = None
+            self.has_more = True
+            self.loading = False
+        self.rows_view.controls.clear()
+        self.load_more()
+
+    def on_scroll(self, e):
+        if e.max_scroll_extent and e.pixels >= e.max_scroll_extent - 200:
+            self.load_more()
+
+    def load_more(self):
+        """Fetches the next page in the background, rows are appended when it arrives."""
+        with self.lock:
+            if self.loading or not self.has_more:
+                return
+            self.loading = True
+            generation = self.generation
+            cursor = self.cursor
+        self.status.value = "Carregando..."
+        self.status.color = ft.Colors.GREY
+        if self.status.page:
+            self.status.update()
+        threading.Thread(target=self.fetch_page, args=(generation, cursor), daemon=True).start()
+
+    def fetch_page(self, generation, cursor):
+        try:
+            rows, next_cursor = self.db.get_sales_page(
+                shop_name=self.app.shop,
+                limit=self.PAGE_SIZE,
+                cursor=cursor,
+                **self.filters()
             )
-            self.dialog.content.content.controls.append(header)
-            
-            if not sales_history:
-                 self.dialog.content.content.controls.append(
-                    ft.Text("Nenhum histórico de vendas encontrado.", color=ft.Colors.GREY)
-                )
-                 return
-
-            for row in sales_history:
-                preco_final = row['Preco Final']
-                if isinstance(preco_final, (int, float)):
-                    preco_final = f"R${preco_final:.2f}"
-                else:
-                    preco_final = "R$0.00"
-
-                produtos = self.safe_parse_products(row['Produtos'])
-
-                ROW_STYLE = ft.ButtonStyle(
-                    shape=ft.RoundedRectangleBorder(radius=5),
-                    overlay_color=ft.Colors.TRANSPARENT,
-                    surface_tint_color=ft.Colors.TRANSPARENT,
-                    padding=10,
-                    animation_duration=300,
-                )
-
-                row_content = ft.ListTile(
-                    title=ft.Row(
-                        controls=[
-                            ft.Text(safe_str(row['Data']), width=150),
-                            ft.Text(safe_str(row['Horario']), width=100),
-                            ft.Text(preco_final, width=150),
-                            ft.Text(safe_str(row['Metodo de pagamento']), width=200),
-                        ],
-                        vertical_alignment=ft.CrossAxisAlignment.CENTER,
-                    ),
-                    trailing=ft.Icon(ft.Icons.CHEVRON_RIGHT, color=ft.Colors.BLUE_GREY_400),
-                    on_click=lambda e, p=produtos: self.show_product_details(p),
-                    hover_color=ft.Colors.BLUE_GREY_800,
-                    dense=True,
-                )
-                self.dialog.content.content.controls.append(row_content)
-
+            error = None
         except Exception as e:
-            self.dialog.content.content.controls.append(
-                ft.Text(f"Erro ao carregar histórico: {e}", color=ft.Colors.RED)
-            )
+            rows, next_cursor, error = [], None, e
+
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.cursor = next_cursor
+            self.has_more = next_cursor is not None
+            self.loading = False
+
+        if error:
+            self.status.value = f"Erro ao carregar histórico: {error}"
+            self.status.color = ft.Colors.RED
+        else:
+            self.rows_view.controls.extend(self.build_row(row) for row in rows)
+            if not self.rows_view.controls:
+                self.status.value = "Nenhum histórico de vendas encontrado."
+            else:
+                self.status.value = "" if self.has_more else f"{len(self.rows_view.controls)} venda(s)"
+        self.page.update()
+
+    def build_row(self, row):
+        # Helper to safely display values
+        def safe_str(val):
+            return str(val) if val is not None and val != 'None' and val != 'nan' else ""
+
+        preco_final = row['Preco Final']
+        if isinstance(preco_final, (int, float)):
+            preco_final = f"R${preco_final:.2f}"
+        else:
+            preco_final = "R$0.00"
+
+        # Parsed only when the row is opened
+        produtos_json = row['Produtos']
+
+        return ft.ListTile(
+            title=ft.Row(
+                controls=[
+                    ft.Text(safe_str(row['Data']), width=150),
+                    ft.Text(safe_str(row['Horario']), width=100),
+                    ft.Text(preco_final, width=150),
+                    ft.Text(safe_str(row['Metodo de pagamento']), width=200),
+                ],
+                vertical_alignment=ft.CrossAxisAlignment.CENTER,
+            ),
+            trailing=ft.Icon(ft.Icons.CHEVRON_RIGHT, color=ft.Colors.BLUE_GREY_400),
+            on_click=lambda e, p=produtos_json: self.show_product_details(self.safe_parse_products(p)),
+            hover_color=ft.Colors.BLUE_GREY_800,
+            dense=True,
+        )
 
     def show_product_details(self, produtos):
         formatted_lines = self.format_products(produtos)
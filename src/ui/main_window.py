@@ -27,6 +27,8 @@ class MainWindow:
 
 
         def close_app(e):
+            # Don't drop sales still waiting in the writer queue
+            self.app.product_db.flush_sales(timeout=5)
             self.page.window.close()
 
         def minimize_app(e):
@@ -312,6 +314,13 @@ class MainWindow:
             tooltip="Histórico",
         )
 
+        self.app.daily_close_fab = ft.FloatingActionButton(
+            icon=ft.Icons.RECEIPT_LONG,
+            bgcolor=ft.Colors.BLUE,
+            on_click=self.app.show_daily_close,
+            tooltip="Fechamento do dia",
+        )
+
         self.app.register_fab = ft.FloatingActionButton(
             icon=ft.Icons.ADD_BOX,
             bgcolor=ft.Colors.BLUE,
@@ -322,6 +331,7 @@ class MainWindow:
         self.page.floating_action_button = ft.Row(
             controls=[
                 self.app.register_fab,
+                self.app.daily_close_fab,
                 self.app.history_fab,
                 self.app.sync_fab
             ],
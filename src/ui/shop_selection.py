@@ -1,6 +1,7 @@
 
 import flet as ft
 import time
+import threading
 import src.ui.sync_client as sync_client
 import src.payment as payment
 import src.ui.main_window
@@ -63,6 +64,8 @@ class ShopSelection:
                 if isinstance(self.app.product_db, local_db.Database):
                      self.app.product_db.set_config('current_shop', shop_name)
                      self.app.shop = shop_name 
+                     threading.Thread(target=self.app.product_db.enable_catalog_index, args=(shop_name,), daemon=True).start()
+                     threading.Thread(target=self.app.product_db.open_barcode_filter, daemon=True).start()
                 else:
                     # Fallback if somehow we are still on AWS DB or mixed state?
                     # This shouldn't happen with new flow, but let's be safe.
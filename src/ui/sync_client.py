@@ -9,6 +9,9 @@ import threading
 import time
 
 class SyncClient:
+    # Downloaded products written per transaction
+    DOWNLOAD_BATCH = 1000
+
     def __init__(self, db_instance: db.Database, server_url=None):
         # server_url is kept for compatibility but ignored
         self.db = db_instance
@@ -48,22 +51,10 @@ class SyncClient:
         }
         
         # 1. Fetch Local Sales pending sync
-        sales_data = []
         try:
-            with self.db.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT timestamp, final_price, payment_method, products_json, sync_status FROM sales WHERE sync_status IS NOT 'synced'")
-                rows = cursor.fetchall()
-                
-                for row in rows:
-                    if not row[3]: continue
-                    sales_data.append({
-                        'timestamp': row[0],
-                        'final_price': row[1],
-                        'payment_method': row[2],
-                        'products_json': row[3],
-                        'sync_status': row[4]
-                        })
+            # Sales still queued in the writer would otherwise wait for the next sync
+            self.db.flush_sales(timeout=30)
+            sales_data = [sale for sale in self.db.get_pending_sales() if sale['products_json']]
         except Exception as e:
             results["message"] = f"Error reading local sales: {e}"
             results["success"] = False
@@ -73,14 +64,12 @@ class SyncClient:
         if not shop_name:
             shop_name = self.db.get_config('current_shop')
         
+        # Batched uploads; each batch is marked synced locally as soon as it lands
         count_up_sales = 0
-        for sale in sales_data:
-            try:
-                self.cloud.record_sale(shop_name, sale)
-                self.db.mark_sale_synced(sale['timestamp'])
-                count_up_sales += 1
-            except Exception as e:
-                print(f"Failed to upload sale: {e}")
+        try:
+            count_up_sales = len(self.cloud.upload_sales(shop_name, sales_data, on_batch=self.db.mark_sales_synced))
+        except Exception as e:
+            print(f"Failed to upload sales: {e}")
         
         results["uploaded_sales"] = count_up_sales
 
@@ -90,33 +79,28 @@ class SyncClient:
             last_sync_ts = self.db.get_last_sync_timestamp()
             current_ts = datetime.now().isoformat()
             
-            aws_products = []
-            cloud_ids_map = {} # For deletion checking
+            cloud_barcodes = set() # For deletion checking
             
             if not last_sync_ts:
                 # FULL SYNC
                 print("Performing FULL SYNC (Baseline)...")
-                aws_products = self.cloud.get_products_delta(shop_name=shop_name, last_sync_ts=None)
+                delta_since = None
                 
-                # FIX: For Full Sync, we must not rely solely on 'aws_products' (which is filtered by shop)
+                # FIX: For Full Sync, we must not rely solely on the downloaded products (which are filtered by shop)
                 # for the deletion map, otherwise we delete cached products from other shops.
                 # We need the GLOBAL list of valid IDs to know what to keep.
                 print("Fetching Global ID list for deletion check...")
-                all_ids = self.cloud.get_all_product_ids()
-                cloud_ids_map = {item['barcode']: item['product_id'] for item in all_ids}
+                cloud_barcodes = {item['barcode'] for item in self.cloud.iter_all_product_ids()}
             else:
                 # DELTA SYNC
                 print(f"Performing DELTA SYNC (Since {last_sync_ts})...")
-                # 1. Fetch Deltas
-                aws_products = self.cloud.get_products_delta(shop_name=shop_name, last_sync_ts=last_sync_ts)
+                delta_since = last_sync_ts
                 
-                # 2. Fetch ALL IDs for deletion detection (Lightweight) - Only if enabled
+                # Fetch ALL IDs for deletion detection (Lightweight) - Only if enabled
                 if enable_deletion_check:
                     print("Fetching Cloud IDs for deletion check...")
-                    all_ids = self.cloud.get_all_product_ids()
-                    cloud_ids_map = {item['barcode']: item['product_id'] for item in all_ids}
-                else:
-                    cloud_ids_map = {} # Empty means we won't delete anything
+                    cloud_barcodes = {item['barcode'] for item in self.cloud.iter_all_product_ids()}
+                # Empty means we won't delete anything
 
             # Local Data
             local_products = self.db.get_all_products_local()
@@ -131,26 +115,29 @@ class SyncClient:
                 if status == 'modified':
                     products_to_upload.append(p_local)
             
-            # Execute Uploads
-            count_prod_up = 0
-            for p in products_to_upload:
-                try:
-                    self.cloud.add_product(p, shop_name)
-                    # Mark as synced on success
-                    self.db.mark_product_synced(p['barcode'])
-                    count_prod_up += 1
-                except Exception as e:
-                    print(f"Failed to upload product {p['barcode']}: {e}")
+            # Execute Uploads (concurrently, one UpdateItem per product)
+            outcomes = self.cloud.add_products([dict(p, prices={shop_name: p.get('preco', 0)}) for p in products_to_upload])
+            uploaded = []
+            for p, (product_id, error) in zip(products_to_upload, outcomes):
+                if error:
+                    print(f"Failed to upload product {p['barcode']}: {error}")
+                else:
+                    uploaded.append(p['barcode'])
+            # Mark as synced on success; failures stay 'modified' for the next sync
+            self.db.mark_products_synced(uploaded)
+            count_prod_up = len(uploaded)
 
             results["products_uploaded"] = count_prod_up
             
             # B) Download Updates (From Delta or Full List)
-            # If Delta, this list only contains changed items.
+            # If Delta, this only contains changed items.
             # If Full, it contains everything.
+            # Streamed from the scan and written in batches, so the catalog is never held in memory
             
+            to_download = []
             count_down = 0
             
-            for p_aws in aws_products:
+            for p_aws in self.cloud.iter_products_delta(shop_name=shop_name, last_sync_ts=delta_since):
                 barcode = p_aws['barcode']
                 
                 # If we just uploaded it, ignore download (we are the source)
@@ -173,7 +160,7 @@ class SyncClient:
                     # Here: if we have local changes remaining (upload failed), we keep local.
                 
                 if should_download:
-                   product_info = {
+                   to_download.append({
                         'product_id': p_aws['product_id'],
                         'barcode': p_aws['barcode'],
                         'categoria': p_aws['categoria'],
@@ -181,24 +168,25 @@ class SyncClient:
                         'marca': p_aws['marca'], # Ensure branding is consistant
                         'brand': p_aws['marca'],
                         'preco': p_aws['preco']
-                   }
-                   self.db.add_product(product_info, shop_name, sync_status='synced')
-                   count_down += 1
+                   })
+                   if len(to_download) >= self.DOWNLOAD_BATCH:
+                       stats = self.db.upsert_products(to_download, shop_name, sync_status='synced')
+                       count_down += stats['inserted'] + stats['updated']
+                       to_download = []
             
+            # One transaction per batch (the timestamp below is only saved once all of them made it)
+            stats = self.db.upsert_products(to_download, shop_name, sync_status='synced')
+            count_down += stats['inserted'] + stats['updated']
             results["downloaded"] = count_down
 
             # C) Process Deletions
-            # Only if map is populated (implies enabled check or Full Sync)
-            # Note: For Full Sync, cloud_ids_map is auto-populated from get_products_delta result?
-            # get_products_delta returns everything in Full Sync mode? 
-            # If get_products_delta(None) returns ALL items, then cloud_ids_map populated from it is complete.
-            # So Full Sync naturally handles deletion without extra call.
-            # Delta Sync needs enable_deletion_check to populate it manually.
+            # Only if the set is populated (implies enabled check or Full Sync)
+            # Delta Sync needs enable_deletion_check to populate it.
             
             products_to_delete = []
-            if cloud_ids_map: 
+            if cloud_barcodes: 
                 for barcode, p_local in local_map.items():
-                    if barcode not in cloud_ids_map:
+                    if barcode not in cloud_barcodes:
                         status = p_local.get('sync_status', 'synced')
                         if status == 'synced':
                             products_to_delete.append(p_local)
@@ -213,6 +201,12 @@ class SyncClient:
             
             # SUCCESS: Update Timestamp
             self.db.set_last_sync_timestamp(current_ts)
+
+            # Re-emit the mapped catalog snapshot if anything changed, for the next launch
+            if shop_name and self.db.catalog_snapshot_stale(shop_name):
+                self.db.write_catalog_snapshot(shop_name)
+            if self.db.barcode_filter_stale():
+                self.db.build_barcode_filter()
             
             msg_parts = ["Sync completed"]
             if count_prod_up > 0: msg_parts.append(f"↑ {count_prod_up}")
@@ -237,6 +231,8 @@ class SyncManager:
         self.app = app
         self.page = app.page
         self.stop_sync_thread = False
+        # Sync and sales compaction both rewrite the sales table: never at the same time
+        self.sales_lock = threading.Lock()
 
     def start_auto_sync(self):
         while not self.stop_sync_thread:
@@ -250,11 +246,22 @@ class SyncManager:
                 # Auto-sync check - we don't need server_ip check anymore, just shop
                 if self.app.product_db.get_config('current_shop'):
                    print("Auto-sync triggering...")
-                   self.run_sync(silent=True)
+                   # run_sync returns right away: wait for it, compaction goes after the upload
+                   self.run_sync(silent=True).join()
+
+                # Archive old synced sales while nobody is ringing up a sale
+                if self.is_idle():
+                    with self.sales_lock:
+                        result = self.app.product_db.compact_sales(should_continue=self.is_idle)
+                    if result['archived']:
+                        print(f"Archived {result['archived']} old sales ({', '.join(result['months'])})")
             except Exception as e:
                 print(f"Auto-sync loop error: {e}")
                 time.sleep(60)
 
+    def is_idle(self):
+        return not any(s.current_sale for s in getattr(self.app, 'stored_sales', []))
+
     def update_fab_status(self, color, tooltip):
         try:
              if hasattr(self.app, 'sync_fab'):
@@ -292,7 +299,8 @@ class SyncManager:
                 # No URL needed
                 client = SyncClient(self.app.product_db)
                 shop_name = getattr(self.app, 'shop', None)
-                result = client.sync(shop_name=shop_name)
+                with self.sales_lock:
+                    result = client.sync(shop_name=shop_name)
                 print(f"Sync result: {result}")
                 
                 if not silent:
@@ -327,5 +335,7 @@ class SyncManager:
                 
                 self.update_fab_status(ft.Colors.RED, f"Erro: {str(e)}")
 
-        threading.Thread(target=sync_process).start()
+        thread = threading.Thread(target=sync_process)
+        thread.start()
+        return thread
 
@@ -3,7 +3,6 @@ from src.aws_db import Database
 import src.db_sqlite as local_db
 import time
 import threading
-import json
 from datetime import datetime
 
 class StoreManagerApp:
@@ -155,63 +154,54 @@ class StoreManagerApp:
                     errors += 1
             
             prod_map = {p['barcode']: p for p in self.current_products}
-            processed_barcodes = set()
 
-            # 1. Save Prices
-            for barcode, shop_name in list(self.dirty_prices):
+            # 1. Prices: every dirty shop price of a product goes in one write
+            prices_by_barcode = {}
+            for barcode, shop_name in self.dirty_prices:
                  if barcode in prod_map:
-                     p = prod_map[barcode]
-                     
-                     price_val = p['prices'].get(shop_name, 0.0)
-                     
-                     product_info = {
-                         'product_id': p.get('product_id'),
-                         'barcode': p['barcode'],
-                         'marca': p.get('marca', ''),
-                         'categoria': p.get('categoria', ''),
-                         'sabor': p.get('sabor', ''),
-                         'preco': price_val
-                     }
-                     
-                     try:
-                         # Update product_id if newly created
-                         new_pid = self.db.add_product(product_info, shop_name)
-                         if not p.get('product_id'):
-                             p['product_id'] = new_pid
-                         count += 1
-                         processed_barcodes.add(barcode)
-                     except Exception as ex:
-                         print(f"Error saving {barcode}/{shop_name}: {ex}")
-                         errors += 1
-
-            # 2. Save Metadata
-            for barcode in list(self.dirty_metadata):
-                if barcode not in processed_barcodes and barcode in prod_map:
+                     prices_by_barcode.setdefault(barcode, {})[shop_name] = prod_map[barcode]['prices'].get(shop_name, 0.0)
+
+            # 2. Metadata only: written along with one of its prices
+            for barcode in self.dirty_metadata:
+                if barcode not in prices_by_barcode and barcode in prod_map:
                     p = prod_map[barcode]
                     target_shop = list(p['prices'].keys())[0] if p['prices'] else (self.known_shops[0] if self.known_shops else None)
                     
                     if target_shop:
-                        price_val = p['prices'].get(target_shop, 0.0)
-                        
-                        product_info = {
-                            'product_id': p.get('product_id'),
-                            'barcode': p['barcode'],
-                            'marca': p.get('marca', ''),
-                            'categoria': p.get('categoria', ''),
-                            'sabor': p.get('sabor', ''),
-                            'preco': price_val
-                        }
-                        try:
-                            new_pid = self.db.add_product(product_info, target_shop)
-                            if not p.get('product_id'):
-                                p['product_id'] = new_pid
-                            count += 1
-                        except Exception as ex:
-                             print(f"Error saving metadata {barcode}: {ex}")
-                             errors += 1
+                        prices_by_barcode[barcode] = {target_shop: p['prices'].get(target_shop, 0.0)}
+
+            barcodes = list(prices_by_barcode)
+            batch = []
+            for barcode in barcodes:
+                p = prod_map[barcode]
+                batch.append({
+                    'product_id': p.get('product_id'),
+                    'barcode': p['barcode'],
+                    'marca': p.get('marca', ''),
+                    'categoria': p.get('categoria', ''),
+                    'sabor': p.get('sabor', ''),
+                    'prices': prices_by_barcode[barcode]
+                })
+
+            # Written concurrently; failures stay dirty (blue) for the next PUSH
+            failed = set()
+            for barcode, (new_pid, error) in zip(barcodes, self.db.add_products(batch)):
+                # Update product_id if newly created (kept on failure too, so a retry reuses it)
+                if not prod_map[barcode].get('product_id'):
+                    prod_map[barcode]['product_id'] = new_pid
+                if error:
+                    print(f"Error saving {barcode}: {error}")
+                    failed.add(barcode)
+                    errors += 1
+                    continue
+                count += 1
             
+            kept_prices = {key for key in self.dirty_prices if key[0] in failed}
+            kept_metadata = {barcode for barcode in self.dirty_metadata if barcode in failed}
             self.dirty_prices.clear()
+            self.dirty_prices.update(kept_prices)
             self.dirty_metadata.clear()
+            self.dirty_metadata.update(kept_metadata)
             self.dirty_new_shops.clear()
             self.dirty_deletes.clear()
             
@@ -442,23 +432,15 @@ class StoreManagerApp:
             last_sync_ts = self.local_db.get_last_sync_timestamp()
             current_ts = datetime.now().isoformat()
             
-            delta_products = []
-            
             if not last_sync_ts:
                 print("StoreManager: Full Sync")
-                delta_products = self.db.get_products_delta(shop_name=None, last_sync_ts=None) # get_products_delta returns aggregated if None or shop specific?
-                # AWS get_products_delta returns flattened rows!
-                # If shop_name is None, it scans everything.
-                # It returns rows: {product_id, barcode, price_ShopA...} -> NO.
-                # Let's check aws_db.get_products_delta again. 
-                # It returns flattened: {..., shop_name: 'Shop A', preco: 10.0}
+                # With shop_name None it scans everything and yields flattened rows:
+                # {..., shop_name: 'Shop A', preco: 10.0}
             else:
                  print(f"StoreManager: Delta Sync since {last_sync_ts}")
-                 delta_products = self.db.get_products_delta(shop_name=None, last_sync_ts=last_sync_ts)
                  
                  # 2. Deletions (Lightweight)
-                 all_ids = self.db.get_all_product_ids()
-                 cloud_ids = {item['barcode'] for item in all_ids}
+                 cloud_ids = {item['barcode'] for item in self.db.iter_all_product_ids()}
                  
                  # Check local deletions
                  local_prods = self.local_db.get_all_products_local()
@@ -468,34 +450,43 @@ class StoreManagerApp:
                          self.local_db.delete_product(p['barcode'])
 
             # 3. Apply Delta to Local DB
+            # Each item is ONE price for ONE shop; upsert_products merges them per product.
+            # Streamed from the scan and written in batches.
+            updates = []
             count_updates = 0
-            for item in delta_products:
-                # Add product merges prices, so this is safe.
-                # Each item is ONE price for ONE shop.
+            got_delta = False
+            for item in self.db.iter_products_delta(shop_name=None, last_sync_ts=last_sync_ts or None):
+                got_delta = True
                 s_name = item.get('shop_name')
                 
                 # Check for shop name being None (if unlisted)
                 # FIX: If s_name is empty, it might be a new product without prices yet.
                 # We still want to add it to local DB to update metadata.
-                # But add_product needs a shop_name to update price? 
-                # If s_name is None/Empty, we just pass None.
-                
                 if not s_name: s_name = None
                 
-                info = {
+                updates.append({
                     'product_id': item['product_id'],
                     'barcode': item['barcode'],
                     'categoria': item.get('categoria', ''),
                     'sabor': item.get('sabor', ''),
                     'marca': item.get('marca', ''),
-                    'preco': item.get('preco', 0.0)
-                }
-                
-                self.local_db.add_product(info, shop_name=s_name, sync_status='synced')
-                count_updates += 1
-            
-            if count_updates > 0 or not last_sync_ts:
+                    'preco': item.get('preco', 0.0),
+                    'shop_name': s_name
+                })
+                if len(updates) >= 1000:
+                    stats = self.local_db.upsert_products(updates, sync_status='synced')
+                    count_updates += stats['inserted'] + stats['updated']
+                    updates = []
+            
+            stats = self.local_db.upsert_products(updates, sync_status='synced')
+            count_updates += stats['inserted'] + stats['updated']
+            
+            if got_delta or not last_sync_ts:
                 self.local_db.set_last_sync_timestamp(current_ts)
+
+            # Local catalog just changed: rebuild the filter the local lookups use
+            if self.local_db.barcode_filter_stale():
+                self.local_db.build_barcode_filter()
             
             # 4. Load from Local (Pivot)
             # Fetch generic shops list? 
@@ -528,35 +519,8 @@ class StoreManagerApp:
                 
                 if bc not in pivot_map:
                     p_id = item.get('product_id')
-                    
-                    # Debug Raw
-                    if bc == '7894900681017':
-                         print(f"DEBUG RAW: Barcode {bc} prices_json val: {item.get('prices_json')}, type: {type(item.get('prices_json'))}")
-
-                    try:
-                        p_json = item.get('prices_json')
-                        if isinstance(p_json, dict):
-                            prices_map = p_json
-                        elif isinstance(p_json, str):
-                            if not p_json or p_json == 'None':
-                                prices_map = {}
-                            else:
-                                try:
-                                    prices_map = json.loads(p_json)
-                                except json.JSONDecodeError as jde:
-                                    print(f"JSON Error for {bc}: {jde}. Content: {p_json}")
-                                    prices_map = {}
-                        else:
-                            prices_map = {}
-
-                        # Debug first item
-                        if bc == '7894900681017' or (len(pivot_map) == 0 and len(prices_map) > 0):
-                             print(f"DEBUG: Parsed prices for {bc}: {prices_map}")
-
-                    except Exception as ex:
-                        print(f"General Error parsing prices for {bc}: {ex}")
-                        prices_map = {}
-                        
+                    prices_map = dict(item.get('prices') or {})
+
                     pivot_map[bc] = {
                         'product_id': p_id,
                         'barcode': bc,
@@ -569,10 +533,6 @@ class StoreManagerApp:
                 # Metadata precedence (if multiple rows had different meta? Local DB row is unique per product now)
                 # So we just take what's in the row.
             
-            # If prices are still empty, maybe we need to fetch them from DB?
-            # get_all_products_local only returns what is in the columns.
-            # If update_delta didn't populate prices_json properly, we are in trouble.
-            
             self.current_products.clear()
             self.current_products.extend(list(pivot_map.values()))
             self.current_products.sort(key=lambda x: x['barcode'])
@@ -739,6 +699,8 @@ class StoreManagerApp:
 
         # 2. Not Found -> Create
         try:
+            # Always asks the cloud: the barcode filter only knows the local cache,
+            # and another device may have created the product since the last PULL
             template = self.db.get_template_by_barcode(barcode)
             if template:
                 new_p = {
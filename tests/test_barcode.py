@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+from src.barcode import barcode_key, canonical_gtin, gtin_check_digit, is_valid_gtin
+
+
+def reference_check_digit(body):
+    # GS1 mod-10 as written in the spec, one digit at a time
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(body)))
+    return str((10 - total % 10) % 10)
+
+
+def test_check_digit_matches_reference():
+    rng = random.Random(17)
+    for length in (7, 11, 12, 13):
+        for _ in range(2000):
+            body = ''.join(rng.choice('0123456789') for _ in range(length))
+            assert gtin_check_digit(body) == reference_check_digit(body), body
+
+
+@pytest.mark.parametrize('code', ['96385074', '036000291452', '7891000315507', '4006381333931', '10012345678902'])
+def test_known_codes_are_valid(code):
+    assert is_valid_gtin(code)
+    assert canonical_gtin(code) == code.zfill(14)
+
+
+def test_forms_of_one_item_share_a_key():
+    assert barcode_key('036000291452') == barcode_key('0036000291452') == barcode_key('00036000291452')
+
+
+@pytest.mark.parametrize('code', ['7891000315508', '789100031550', 'ABC123', '', None, '٠٣٦٠٠٠٢٩١٤٥٢'])
+def test_other_codes_match_only_themselves(code):
+    assert canonical_gtin(code) is None
+    assert barcode_key(code) == code
@@ -0,0 +1,59 @@
+from src.catalog_index import CatalogIndex
+from src.db_sqlite import Database
+
+PRODUCTS = [
+    {'product_id': 'p1', 'barcode': '036000291452', 'marca': 'Marca', 'categoria': 'Picolé', 'sabor': 'Uva', 'prices': {'Loja A': 5.0}},
+    {'product_id': 'p2', 'barcode': '7891000315507', 'marca': 'Outra', 'categoria': 'Pote', 'sabor': 'Açaí', 'prices': {'Loja A': 12.5, 'Loja B': 13.0}},
+    {'product_id': 'p3', 'barcode': 'INTERNO-7', 'marca': '', 'categoria': '', 'sabor': '', 'prices': {'Loja B': 1.0}},
+    {'product_id': 'p4', 'barcode': '0036000291452', 'marca': 'Dup', 'categoria': 'Picolé', 'sabor': '', 'prices': {}},
+]
+
+
+def _db(tmp_path):
+    db = Database(str(tmp_path / 'database.db'))
+    db.replace_all_products(PRODUCTS)
+    return db
+
+
+def test_index_from_snapshot_matches_sql(tmp_path):
+    db = _db(tmp_path)
+    try:
+        assert db.write_catalog_snapshot('Loja A')
+        index = db.enable_catalog_index('Loja A')
+
+        from_sql = CatalogIndex('Loja A')
+        sql, params = db._product_select('Loja A')
+        from_sql.load(db._row_to_dict(r) for r in db.get_connection().execute(sql, params))
+
+        for pid in ('p1', 'p2', 'p3', 'p4', 'missing'):
+            assert index.get(pid) == from_sql.get(pid)
+        # UPC-A and EAN-13 forms of one GTIN share a key
+        for code in ('036000291452', '0036000291452', '7891000315507', 'INTERNO-7', '123'):
+            assert sorted(p['product_id'] for p in index.find_barcode(code)) == sorted(p['product_id'] for p in from_sql.find_barcode(code))
+        assert len(index.find_barcode('036000291452')) == 2
+    finally:
+        db.close()
+
+
+def test_snapshot_lookups(tmp_path):
+    db = _db(tmp_path)
+    try:
+        db.write_catalog_snapshot('Loja A')
+        snapshot = db.catalog_snapshot
+        assert snapshot.get('p2') == db.get_product_info('p2', 'Loja A')
+        assert snapshot.get('nope') is None
+        assert sorted(p['product_id'] for p in snapshot.find_barcode('00036000291452')) == ['p1', 'p4']
+        assert snapshot.find_barcode('999') == []
+    finally:
+        db.close()
+
+
+def test_stale_snapshot_is_not_loaded(tmp_path):
+    db = _db(tmp_path)
+    try:
+        db.write_catalog_snapshot('Loja A')
+        db.add_product({'barcode': '4006381333931', 'marca': 'Nova', 'preco': 3.0}, 'Loja A')
+        index = db.enable_catalog_index('Loja A')
+        assert [p['marca'] for p in index.find_barcode('4006381333931')] == ['Nova']
+    finally:
+        db.close()
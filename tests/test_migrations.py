@@ -0,0 +1,162 @@
+import json
+import sqlite3
+
+import pytest
+
+from src.db_sqlite import MIGRATIONS, ConnectionPool, Database
+
+SALE_PRODUCTS = json.dumps({
+    'p1': {'categoria': 'Bebidas', 'sabor': 'Uva', 'preco': 5.0, 'quantidade': 2},
+    'p2': {'categoria': 'Doces', 'sabor': '', 'preco': 2.5, 'quantidade': 1},
+})
+
+# Historical layouts a POS may still have on disk (all at user_version 0)
+
+LEGACY_SALES_NO_SYNC_STATUS = """
+    CREATE TABLE sales (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        final_price REAL,
+        payment_method TEXT,
+        products_json TEXT
+    );
+    CREATE TABLE config (key TEXT PRIMARY KEY, value TEXT);
+    CREATE TABLE products (
+        product_id TEXT PRIMARY KEY, barcode TEXT, brand TEXT, category TEXT, flavor TEXT,
+        price REAL, prices_json TEXT DEFAULT '{}', metadata_json TEXT, sync_status TEXT DEFAULT 'synced'
+    );
+"""
+
+LEGACY_PRODUCTS_NO_SYNC_STATUS = """
+    CREATE TABLE sales (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        final_price REAL,
+        payment_method TEXT,
+        products_json TEXT,
+        sync_status TEXT DEFAULT 'pending'
+    );
+    CREATE TABLE config (key TEXT PRIMARY KEY, value TEXT);
+    CREATE TABLE products (
+        product_id TEXT PRIMARY KEY, barcode TEXT, brand TEXT, category TEXT, flavor TEXT,
+        price REAL, metadata_json TEXT
+    );
+"""
+
+PRE_VERSIONING_CURRENT = """
+    CREATE TABLE sales (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        final_price REAL,
+        payment_method TEXT,
+        products_json TEXT,
+        sync_status TEXT DEFAULT 'pending'
+    );
+    CREATE TABLE config (key TEXT PRIMARY KEY, value TEXT);
+    CREATE TABLE products (
+        product_id TEXT PRIMARY KEY, barcode TEXT, brand TEXT, category TEXT, flavor TEXT,
+        price REAL, prices_json TEXT DEFAULT '{}', metadata_json TEXT, sync_status TEXT DEFAULT 'synced'
+    );
+    CREATE INDEX idx_barcode ON products(barcode);
+"""
+
+
+def _legacy_db(path, schema):
+    conn = sqlite3.connect(path)
+    conn.executescript(schema)
+    sales_columns = [r[1] for r in conn.execute("PRAGMA table_info(sales)")]
+    product_columns = [r[1] for r in conn.execute("PRAGMA table_info(products)")]
+
+    sale = {'timestamp': '2024-03-01 10:00:00', 'final_price': 12.5, 'payment_method': 'Pix', 'products_json': SALE_PRODUCTS}
+    if 'sync_status' in sales_columns:
+        sale['sync_status'] = 'pending'
+    conn.execute(f"INSERT INTO sales ({', '.join(sale)}) VALUES ({', '.join('?' * len(sale))})", list(sale.values()))
+
+    for pid, barcode in (('p1', '7891000315507'), ('p2', '036000291452')):
+        product = {'product_id': pid, 'barcode': barcode, 'brand': 'Marca', 'category': 'Cat', 'flavor': '',
+                   'price': 5.0, 'metadata_json': json.dumps({'nome': pid})}
+        if 'prices_json' in product_columns:
+            product['prices_json'] = json.dumps({'Loja A': 5.0, 'Loja B': 6.0})
+        conn.execute(f"INSERT INTO products ({', '.join(product)}) VALUES ({', '.join('?' * len(product))})", list(product.values()))
+    conn.execute("INSERT INTO config (key, value) VALUES ('current_shop', 'Loja A')")
+    conn.commit()
+    conn.close()
+
+
+def _open(path):
+    db = Database(path)
+    conn = db.get_connection()
+    return db, conn
+
+
+@pytest.mark.parametrize('schema', [
+    LEGACY_SALES_NO_SYNC_STATUS,
+    LEGACY_PRODUCTS_NO_SYNC_STATUS,
+    PRE_VERSIONING_CURRENT,
+], ids=['sales-without-sync-status', 'products-without-sync-status', 'pre-versioning-current'])
+def test_legacy_layout_migrates(tmp_path, schema):
+    path = str(tmp_path / 'database.db')
+    _legacy_db(path, schema)
+    db, conn = _open(path)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+
+        # Sales: one row keyed by a UUID, items unpacked into sale_items
+        sales = conn.execute("SELECT sale_id, timestamp, final_price, payment_method, sync_status FROM sales").fetchall()
+        assert len(sales) == 1
+        sale_id, timestamp, final_price, payment_method, sync_status = sales[0]
+        assert len(sale_id) == 36 and timestamp == '2024-03-01 10:00:00'
+        assert (final_price, payment_method) == (12.5, 'Pix')
+        # Sales from before sync_status existed were already uploaded
+        assert sync_status == ('synced' if schema is LEGACY_SALES_NO_SYNC_STATUS else 'pending')
+        items = conn.execute("SELECT product_id, category, price, quantity FROM sale_items ORDER BY product_id").fetchall()
+        assert items == [('p1', 'Bebidas', 5.0, 2), ('p2', 'Doces', 2.5, 1)]
+
+        # Products: kept, with a gtin so UPC-A and EAN-13 forms agree
+        products = conn.execute("SELECT product_id, barcode, sync_status, gtin FROM products ORDER BY product_id").fetchall()
+        assert products == [
+            ('p1', '7891000315507', 'synced', '07891000315507'),
+            ('p2', '036000291452', 'synced', '00036000291452'),
+        ]
+        assert db.get_products_by_barcode_and_shop('0036000291452')[0]['product_id'] == 'p2'
+
+        prices = conn.execute("SELECT product_id, shop, price FROM product_prices ORDER BY product_id, shop").fetchall()
+        if schema is LEGACY_PRODUCTS_NO_SYNC_STATUS:
+            # No prices_json to unpack
+            assert prices == []
+        else:
+            assert prices == [('p1', 'Loja A', 5.0), ('p1', 'Loja B', 6.0), ('p2', 'Loja A', 5.0), ('p2', 'Loja B', 6.0)]
+
+        assert db.get_config('current_shop') == 'Loja A'
+    finally:
+        db.close()
+
+
+def test_new_database_is_current(tmp_path):
+    db, conn = _open(str(tmp_path / 'database.db'))
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    finally:
+        db.close()
+
+
+def test_second_open_only_reads_the_version(tmp_path, monkeypatch):
+    path = str(tmp_path / 'database.db')
+    _legacy_db(path, PRE_VERSIONING_CURRENT)
+    Database(path).close()
+
+    statements = []
+    connect = ConnectionPool._connect
+
+    def traced_connect(pool):
+        conn = connect(pool)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(ConnectionPool, '_connect', traced_connect)
+    db = Database(path)
+    try:
+        # A new connection is opened (the first one was closed); init_db is all that runs on it
+        assert statements == ['PRAGMA user_version']
+    finally:
+        db.close()
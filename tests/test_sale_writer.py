@@ -0,0 +1,94 @@
+import sqlite3
+import threading
+
+from src.db_sqlite import Database
+from src.sale_writer import SaleWriter
+
+PRODUCERS = 8
+SALES_PER_PRODUCER = 60
+
+
+def _products(n):
+    return {
+        f'p{n}-a': {'categoria': 'Bebidas', 'sabor': 'Uva', 'preco': 5.0, 'quantidade': 1},
+        f'p{n}-b': {'categoria': 'Doces', 'sabor': '', 'preco': 2.5, 'quantidade': 2},
+    }
+
+
+def test_concurrent_sales_against_sync_and_lock_holders(tmp_path):
+    path = str(tmp_path / 'database.db')
+    db = Database(path)
+    stop = threading.Event()
+    errors = []
+    tickets = []
+    tickets_lock = threading.Lock()
+
+    def producer(worker):
+        try:
+            for i in range(SALES_PER_PRODUCER):
+                ticket = db.enqueue_sale(10.0, 'Pix', _products(worker * 1000 + i))
+                with tickets_lock:
+                    tickets.append(ticket)
+        except Exception as e:
+            errors.append(e)
+
+    def syncer():
+        # What the sync does after an upload, on its own thread and connection
+        try:
+            while not stop.is_set():
+                pending = [s['sale_id'] for s in db.get_pending_sales()]
+                if pending:
+                    db.mark_sales_synced(pending)
+        except Exception as e:
+            errors.append(e)
+
+    def lock_holder():
+        # Another process (backup, second window) grabbing the write lock for a while
+        conn = sqlite3.connect(path, timeout=10)
+        try:
+            while not stop.is_set():
+                conn.execute("BEGIN IMMEDIATE")
+                stop.wait(0.05)
+                conn.commit()
+                stop.wait(0.01)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    background = [threading.Thread(target=syncer), threading.Thread(target=lock_holder)]
+    producers = [threading.Thread(target=producer, args=(n,)) for n in range(PRODUCERS)]
+    for t in background + producers:
+        t.start()
+    try:
+        for t in producers:
+            t.join()
+        assert all(ticket.wait(timeout=60) for ticket in tickets), [t.error for t in tickets if t.error]
+        assert db.flush_sales(timeout=60)
+    finally:
+        stop.set()
+        for t in background:
+            t.join()
+
+    try:
+        assert errors == []
+        total = PRODUCERS * SALES_PER_PRODUCER
+        assert len(tickets) == total
+        sale_ids = {ticket.sale_id for ticket in tickets}
+        assert len(sale_ids) == total and None not in sale_ids
+
+        conn = db.get_connection()
+        assert conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0] == total
+        assert conn.execute("SELECT COUNT(*) FROM sale_items").fetchone()[0] == 2 * total
+        # Every sale has both of its items
+        assert conn.execute("""
+            SELECT COUNT(*) FROM sales s
+            WHERE (SELECT COUNT(*) FROM sale_items i WHERE i.sale_id = s.sale_id) != 2
+        """).fetchone()[0] == 0
+        stored = {r[0] for r in conn.execute("SELECT sale_id FROM sales")}
+        assert stored == sale_ids
+    finally:
+        writer = SaleWriter.running(db)
+        if writer is not None:
+            writer.close(timeout=10)
+        db.close()
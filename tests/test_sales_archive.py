@@ -0,0 +1,79 @@
+from src.db_sqlite import Database
+
+SALES = 100
+ITEMS = {'P1': {'categoria': 'Bebidas', 'sabor': 'Uva', 'preco': 5.0, 'quantidade': 1}}
+
+
+def _db_with_old_sales(tmp_path):
+    db = Database(str(tmp_path / 'database.db'))
+    ids = [
+        db.record_sale(5.0, 'Pix', ITEMS, timestamp=f'2024-01-{1 + i % 28:02d} 10:{i // 60:02d}:{i % 60:02d}.000000')
+        for i in range(SALES)
+    ]
+    db.mark_sales_synced(ids)
+    db.archiver.batch_size = 10
+    return db, set(ids)
+
+
+def _all_pages(db, limit):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = db.get_sales_page(limit=limit, cursor=cursor)
+        seen.extend(r['sale_id'] for r in rows)
+        if cursor is None:
+            return seen
+
+
+def _stop_after(calls):
+    left = [calls]
+
+    def should_continue():
+        left[0] -= 1
+        return left[0] >= 0
+    return should_continue
+
+
+def test_interrupted_compaction_pages_each_sale_once(tmp_path):
+    db, ids = _db_with_old_sales(tmp_path)
+    try:
+        # One check before the month, then one per batch: three batches of ten get moved
+        result = db.archiver.compact(horizon_days=30, should_continue=_stop_after(4))
+        assert result['archived'] == 30
+        conn = db.get_connection()
+        assert conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0] == SALES - 30
+        # The month isn't done: the horizon for "fully moved" doesn't move
+        assert db.archiver.archived_until() is None
+
+        rows, _ = db.get_sales_page(limit=SALES)
+        assert sorted(r['sale_id'] for r in rows) == sorted(ids)
+        for limit in (7, 25, SALES + 5):
+            paged = _all_pages(db, limit)
+            assert len(paged) == len(set(paged)) == SALES
+            assert set(paged) == ids
+
+        # The next run picks up the rest
+        result = db.archiver.compact(horizon_days=30)
+        assert result['archived'] == SALES - 30
+        assert db.archiver.archived_until() == '2024-02-01'
+        paged = _all_pages(db, 7)
+        assert len(paged) == len(set(paged)) == SALES
+    finally:
+        db.close()
+
+
+def test_copies_left_by_a_crash_are_paged_once(tmp_path):
+    # A crash between writing the month file and the deletes leaves every sale in both places
+    db, ids = _db_with_old_sales(tmp_path)
+    try:
+        conn = db.get_connection()
+        rows = conn.execute("SELECT sale_id, timestamp, final_price, payment_method, products_json, sync_status FROM sales").fetchall()
+        items = conn.execute("SELECT sale_id, product_id, category, flavor, price, quantity FROM sale_items").fetchall()
+        db.archiver._publish('2024-01', rows, items)
+        # Same as after a run that got past the month: paging opens the archive for it
+        db.set_config('sales_archived_until', '2024-02-01')
+
+        paged = _all_pages(db, 9)
+        assert len(paged) == len(set(paged)) == SALES
+        assert set(paged) == ids
+    finally:
+        db.close()